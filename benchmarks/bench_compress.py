@@ -0,0 +1,137 @@
+'''
+上传图片压缩基准: 改造前的compress_image(质量每次降10, 按字节比例缩放边长) vs 当前实现
+
+语料为运行时生成的合成图片(照片类JPEG、截图类PNG、带透明通道的PNG、带EXIF的JPEG和PNG),
+输出每张图片的编码次数、压缩后大小、尺寸、是否超出上限和耗时, 最后汇总两种实现的差异.
+改造前的实现不处理边长上限, 超限时直接返回超出上限的结果, PNG按字节比例缩小边长(缩得过小),
+因此耗时更短、输出更小; 对比时需要同时看超限数量和输出像素数
+
+用法:
+    python benchmarks/bench_compress.py [--max-size 102400] [--max-dimension 2048] [--webp]
+'''
+
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from PIL import Image, ImageDraw, ImageFilter
+from img_generator.compress import compress_image
+
+
+def photo(size, detail):
+    """照片类图片: 模糊噪声叠加渐变, detail越大细节越多"""
+    noise = Image.effect_noise(size, 90).filter(ImageFilter.GaussianBlur(max(0.5, 6 - detail)))
+    gradient = Image.linear_gradient('L').resize(size)
+    return Image.merge('RGB', (noise, gradient, Image.blend(noise, gradient, 0.5)))
+
+
+def screenshot(size):
+    """截图类图片: 大面积纯色块和文字"""
+    img = Image.new('RGB', size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    for y in range(0, size[1], 60):
+        draw.rectangle([20, y + 10, size[0] - 20, y + 50], fill=(255, 255, 255), outline=(220, 220, 220))
+        draw.text((40, y + 22), f"row {y // 60} ballkeeper 球队 联赛 活动", fill=(30, 30, 30))
+    return img
+
+
+def encode(img, fmt, **params):
+    output = io.BytesIO()
+    img.save(output, format=fmt, **params)
+    return output.getvalue()
+
+
+def build_corpus():
+    rotated = photo((2000, 1500), 3)
+    exif = rotated.getexif()
+    exif[0x0112] = 6  # Orientation: 顺时针旋转90度
+    exif[0x010F] = "bench camera"
+    screenshot_exif = Image.Exif()
+    screenshot_exif[0x010F] = "bench phone"
+    transparent = photo((1200, 1200), 2).convert('RGBA')
+    transparent.putalpha(Image.linear_gradient('L').resize((1200, 1200)))
+    return [
+        ("photo_4000x3000_q95", '.jpg', encode(photo((4000, 3000), 3), 'JPEG', quality=95)),
+        ("photo_3000x4000_detail", '.jpg', encode(photo((3000, 4000), 5), 'JPEG', quality=92)),
+        ("photo_1280x960_q85", '.jpg', encode(photo((1280, 960), 2), 'JPEG', quality=85)),
+        ("photo_exif_rotated", '.jpg', encode(rotated, 'JPEG', quality=95, exif=exif.tobytes())),
+        ("screenshot_1080x2340", '.png', encode(screenshot((1080, 2340)), 'PNG')),
+        ("screenshot_png_exif", '.png', encode(screenshot((1080, 2340)), 'PNG', exif=screenshot_exif.tobytes())),
+        ("photo_png_1600x1200", '.png', encode(photo((1600, 1200), 3), 'PNG')),
+        ("transparent_png_1200", '.png', encode(transparent, 'PNG')),
+    ]
+
+
+def legacy_compress(image_data, file_extension, max_size):
+    """改造前的实现, 返回(数据, 编码次数)"""
+    if len(image_data) <= max_size:
+        return image_data, 0
+    img = Image.open(io.BytesIO(image_data))
+    output = io.BytesIO()
+    encodes = 0
+    if file_extension in ['.jpg', '.jpeg']:
+        quality = 90
+        while quality > 10:
+            output.seek(0)
+            output.truncate(0)
+            img.save(output, format='JPEG', quality=quality)
+            encodes += 1
+            if output.tell() <= max_size:
+                break
+            quality -= 10
+    else:
+        if img.mode == 'RGBA':
+            img = img.convert('RGB')
+        ratio = min(1.0, max_size / len(image_data))
+        img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.LANCZOS)
+        img.save(output, format='PNG', optimize=True)
+        encodes += 1
+    return output.getvalue(), encodes
+
+
+def dimensions(data):
+    return Image.open(io.BytesIO(data)).size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-size", type=int, default=100 * 1024)
+    parser.add_argument("--max-dimension", type=int, default=2048)
+    parser.add_argument("--webp", action="store_true", help="当前实现输出WebP")
+    args = parser.parse_args()
+
+    print(f"{'image':<24}{'input':>9}  {'impl':<7}{'encodes':>8}{'output':>9}{'dims':>11}{'over':>6}{'ms':>9}")
+    # 编码次数, 超限数, 耗时(ms), 输出大小(字节), 输出像素数
+    totals = {'legacy': [0, 0, 0, 0, 0], 'current': [0, 0, 0, 0, 0]}
+    for name, ext, data in build_corpus():
+        start = time.perf_counter()
+        legacy_data, legacy_encodes = legacy_compress(data, ext, args.max_size)
+        legacy_ms = (time.perf_counter() - start) * 1000
+        result = compress_image(data, ext, args.max_size, args.webp, args.max_dimension)
+
+        rows = [
+            ('legacy', legacy_encodes, legacy_data, legacy_ms),
+            ('current', result.encodes, result.data, result.elapsed * 1000),
+        ]
+        for impl, encodes, output, ms in rows:
+            over = len(output) > args.max_size
+            width, height = dimensions(output)
+            print(f"{name:<24}{len(data) / 1024:>8.0f}K  {impl:<7}{encodes:>8}{len(output) / 1024:>8.1f}K"
+                  f"{f'{width}x{height}':>11}{'yes' if over else '':>6}{ms:>9.1f}")
+            for i, value in enumerate((encodes, over, ms, len(output), width * height)):
+                totals[impl][i] += value
+
+    for impl, (encodes, over, ms, size, pixels) in totals.items():
+        print(f"{impl}: {encodes} encodes, {over} over budget, {ms:.0f}ms total, "
+              f"{size / 1024:.0f}KB output, {pixels / 1e6:.1f}MP output")
+    legacy, current = totals['legacy'], totals['current']
+    print(f"current vs legacy: encodes {current[0] - legacy[0]:+d}, time {current[2] - legacy[2]:+.0f}ms "
+          f"({(current[2] / legacy[2] - 1) * 100:+.0f}%), output {(current[3] - legacy[3]) / 1024:+.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+'''
+并发请求延迟基准: 同步Session vs 异步Session
+
+在临时目录中创建SQLite数据库并写入若干活动, 同时发起多个慢查询(无索引的LIKE全表扫描)
+和轻量请求(hello_world), 统计轻量请求的延迟。同步Session会在事件循环线程上执行查询,
+导致轻量请求被慢查询阻塞; 异步Session则不会。
+
+用法:
+    python benchmarks/bench_db_concurrency.py [--activities 200000] [--concurrency 10]
+'''
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+# NOTE: 切换到临时目录, 使相对路径的数据库文件落在临时目录中
+os.chdir(tempfile.mkdtemp(prefix="ballkeeper_bench_"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import httpx
+from fastapi import FastAPI, Depends
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.database import engine, init_db, get_session
+from db.models import Activity
+from routers import others
+
+
+def seed(n):
+    with Session(engine) as session:
+        session.add_all([
+            Activity(name=f"activity_{i}", type_id=1, mobile="", creator_id=1, content=f"content_{i}" * 8)
+            for i in range(n)
+        ])
+        session.commit()
+
+
+def slow_query():
+    """content无索引, LIKE '%kw%' 会全表扫描, 返回结果很小, 耗时集中在数据库"""
+    return select(func.count()).select_from(Activity).where(Activity.content.contains("needle"))
+
+
+def build_sync_app():
+    """改造前的写法: async路由中直接使用同步Session"""
+    app = FastAPI()
+
+    def get_sync_session():
+        with Session(engine) as session:
+            yield session
+
+    @app.get('/bench/slow_query/')
+    async def slow(session: Session = Depends(get_sync_session)):
+        return {'count': session.exec(slow_query()).one()}
+
+    app.include_router(others.router)
+    return app
+
+
+def build_async_app():
+    """改造后的写法: 使用get_session提供的AsyncSession"""
+    app = FastAPI()
+
+    @app.get('/bench/slow_query/')
+    async def slow(session: AsyncSession = Depends(get_session)):
+        return {'count': (await session.exec(slow_query())).one()}
+
+    app.include_router(others.router)
+    return app
+
+
+async def run(app, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def timed(url, start=None):
+            # start为计划发起时间: 事件循环被阻塞导致的推迟也计入延迟
+            start = start or time.perf_counter()
+            r = await client.get(url)
+            r.raise_for_status()
+            return time.perf_counter() - start
+
+        slow = asyncio.ensure_future(asyncio.gather(*[timed('/bench/slow_query/') for _ in range(concurrency)]))
+
+        # 慢查询执行期间, 按固定间隔(5ms)计划发起轻量请求
+        fast = []
+        t0 = time.perf_counter()
+        i = 0
+        while not slow.done():
+            i += 1
+            planned = t0 + i * 0.005
+            await asyncio.sleep(max(0, planned - time.perf_counter()))
+            fast.append(asyncio.ensure_future(timed('/ballkeeper/', planned)))
+        return await slow, await asyncio.gather(*fast)
+
+
+def report(name, slow, fast):
+    fast_ms = sorted(t * 1000 for t in fast)
+    print(f"{name:>6}: hello n={len(fast_ms):5d} p50={statistics.median(fast_ms):8.1f}ms "
+          f"max={fast_ms[-1]:8.1f}ms | slow_query p50={statistics.median(slow) * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--activities', type=int, default=200000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+
+    init_db()
+    seed(args.activities)
+
+    report("sync", *asyncio.run(run(build_sync_app(), args.concurrency)))
+    report("async", *asyncio.run(run(build_async_app(), args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+'''
+默认图片渲染基准: 逐行draw.line绘制渐变 vs gen_gradient一次性混合
+
+用法:
+    python benchmarks/bench_img_gen.py [--repeat 20]
+'''
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from PIL import Image, ImageDraw
+from img_generator.img_gen import gen_gradient, gen_txt_img
+
+SIZES = [50, 100, 256, 512, 1024]
+COLOR1 = (60, 120, 180)
+COLOR2 = (190, 80, 70)
+
+
+def legacy_gradient(size, color1, color2):
+    """改造前的实现: 每个像素行调用一次draw.line"""
+    img = Image.new('RGB', size)
+    draw = ImageDraw.Draw(img)
+    for y in range(size[1]):
+        ratio = y / size[1]
+        r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
+        g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
+        b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
+        draw.line([(0, y), (size[0], y)], fill=(r, g, b))
+    return img
+
+
+def bench(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'legacy(ms)':>12} {'gradient(ms)':>13} {'speedup':>8} {'gen_txt_img(ms)':>16}")
+    for n in SIZES:
+        size = (n, n)
+        legacy = bench(lambda: legacy_gradient(size, COLOR1, COLOR2), args.repeat)
+        batched = bench(lambda: gen_gradient(size, COLOR1, COLOR2), args.repeat)
+        full = bench(lambda: gen_txt_img("球队", size, (COLOR1, COLOR2)), args.repeat)
+        print(f"{n:>6} {legacy:>12.3f} {batched:>13.3f} {legacy / batched:>7.1f}x {full:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
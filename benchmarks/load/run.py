@@ -0,0 +1,311 @@
+'''
+全部路由的负载测试
+
+复制 seed.py 生成的数据库到临时目录, 启动本地uvicorn, 用并发异步客户端依次压测每个路由,
+输出每个路由的p50/p95/p99延迟(毫秒)、吞吐量(请求/秒)和状态码分布(JSON).
+通过 /openapi.json 检查场景是否覆盖了全部路由.
+
+与基线比较时, p50和p95都超过基线的 --threshold 倍且增加超过 --min-delta 毫秒, 或出现5xx, 视为退化, 以非0状态码退出.
+基线只在相同机器、相同数据规模和参数下可比
+
+用法:
+    python benchmarks/load/seed.py --db /tmp/ballkeeper_load.db
+    python benchmarks/load/run.py --db /tmp/ballkeeper_load.db [--requests 300] [--concurrency 16] [--workers 1]
+        [--output result.json] [--baseline benchmarks/load/baseline.json] [--save-baseline]
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import Counter
+
+import httpx
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SEARCH_WORDS = ["红队", "猛虎", "雄鹰", "足球", "周末", "team1", "activity2", "联赛"]
+
+
+class Context:
+    """场景共用的数据: 数据规模、已登录用户的令牌、上传用的图片"""
+
+    def __init__(self, volumes, tokens, image, run_id):
+        self.volumes = volumes
+        self.tokens = tokens
+        self.image = image
+        self.run_id = run_id
+        self.rng = random.Random(1)
+        self.counter = 0
+
+    def id(self, table):
+        return self.rng.randint(1, self.volumes[table])
+
+    def ids(self, table, n=10):
+        return [self.id(table) for _ in range(n)]
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}_{self.run_id}_{self.counter}"
+
+    def auth(self):
+        return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+
+
+# 场景名 -> 生成单个请求 (method, url, kwargs) 的函数
+SCENARIOS = {
+    "hello_world": lambda c: ("GET", "/ballkeeper/", {}),
+    "get_app_info": lambda c: ("GET", "/ballkeeper/get_app_info/", {}),
+    "register": lambda c: ("POST", "/ballkeeper/register/", {"json": {"username": c.unique("load"), "password": "pw"}}),
+    "login": lambda c: ("POST", "/ballkeeper/login/", {"json": {"username": f"user{c.id('users')}", "password": "pw"}}),
+    "get_user": lambda c: ("GET", "/ballkeeper/get_user/", {"params": {"user_id": c.id("users")}}),
+    "get_users_by_ids": lambda c: ("GET", "/ballkeeper/get_users_by_ids/", {"params": {"user_ids": c.ids("users")}}),
+    "create_team": lambda c: ("POST", "/ballkeeper/create_team/", {"headers": c.auth(), "json": {
+        "name": c.unique("team"), "team_type": 1, "is_public": True, "mobile": ""}}),
+    "get_team": lambda c: ("GET", "/ballkeeper/get_team/", {"params": {"team_id": c.id("teams")}}),
+    "get_teams_by_ids": lambda c: ("GET", "/ballkeeper/get_teams_by_ids/", {"params": {"team_ids": c.ids("teams")}}),
+    "get_team_list": lambda c: ("GET", "/ballkeeper/get_team_list/", {"headers": c.auth(), "params": {
+        "keyword": "", "limit": 10, "img_size": 64}}),
+    "follow_team": lambda c: ("POST", "/ballkeeper/follow_team/", {"headers": c.auth(), "json": {"team_id": c.id("teams")}}),
+    "create_league": lambda c: ("POST", "/ballkeeper/create_league/", {"headers": c.auth(), "json": {
+        "name": c.unique("league"), "league_type_ind": 1, "mobile": ""}}),
+    "get_league": lambda c: ("GET", "/ballkeeper/get_league/", {"params": {"league_id": c.id("leagues")}}),
+    "get_leagues": lambda c: ("GET", "/ballkeeper/get_leagues/", {"params": {"limit": 10, "img_size": 256}}),
+    "get_my_leagues": lambda c: ("GET", "/ballkeeper/get_my_leagues/", {"headers": c.auth(), "params": {"limit": 10}}),
+    "create_activity": lambda c: ("POST", "/ballkeeper/create_activity/", {"json": {
+        "name": c.unique("activity"), "type_id": 1, "mobile": "", "creator_id": c.id("users"),
+        "team_id": c.id("teams"), "max_attend": 20}}),
+    "get_my_activities": lambda c: ("GET", "/ballkeeper/get_my_activities/", {"params": {"user_id": c.id("users")}}),
+    "get_activities": lambda c: ("GET", "/ballkeeper/get_activities/", {"params": {"limit": 10}}),
+    "get_activities_by_ids": lambda c: ("GET", "/ballkeeper/get_activities_by_ids/", {"params": {
+        "activity_ids": c.ids("activities")}}),
+    "get_act_users": lambda c: ("GET", "/ballkeeper/get_act_users/", {"params": {"act_id": c.id("activities")}}),
+    "get_activity": lambda c: ("GET", "/ballkeeper/get_activity/", {"params": {"activity_id": c.id("activities")}}),
+    "signup_act": lambda c: ("POST", "/ballkeeper/signup_act/", {"json": {
+        "act_id": c.id("activities"), "user_id": c.id("users"), "signup_type": c.rng.randint(1, 3)}}),
+    "signup_act_batch": lambda c: ("POST", "/ballkeeper/signup_act_batch/", {"json": {
+        "act_id": c.id("activities"),
+        "signups": [{"user_id": user_id, "signup_type": c.rng.randint(1, 3)} for user_id in c.ids("users")]}}),
+    "search": lambda c: ("GET", "/ballkeeper/search/", {"params": {"keyword": c.rng.choice(SEARCH_WORDS), "limit": 10}}),
+    "upload_image": lambda c: ("POST", "/ballkeeper/upload_image/", {
+        "data": {"image_type": "avatar"}, "files": {"image": ("photo.jpg", c.image, "image/jpeg")}}),
+}
+
+
+def percentile(values, p):
+    """最近秩法分位数"""
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+def test_image():
+    """上传用的JPEG: 1600x1200的噪声图, 需要压缩"""
+    from PIL import Image
+    output = io.BytesIO()
+    Image.effect_noise((1600, 1200), 60).convert('RGB').save(output, format='JPEG', quality=95)
+    return output.getvalue()
+
+
+def read_volumes(path):
+    conn = sqlite3.connect(path)
+    volumes = {table: conn.execute(f"SELECT max(id) FROM {table}").fetchone()[0] or 0
+               for table in ("users", "teams", "leagues", "activities")}
+    volumes["activity_users"] = conn.execute("SELECT count(*) FROM activity_users").fetchone()[0]
+    conn.close()
+    return volumes
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir, db_path, port, workers):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        IMG_DIR=os.path.join(workdir, "images"),
+        SECRET_KEY="load-test",
+        LOG_SAMPLE_RATE="0",
+        LOG_LEVEL="WARNING",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SRC_DIR, "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env
+    )
+
+
+async def wait_ready(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if (await client.get("/ballkeeper/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def run_scenario(client, context, build, requests, concurrency, warmup):
+    """发起requests个请求, 同时最多concurrency个, 返回延迟统计"""
+    for _ in range(warmup):
+        method, url, kwargs = build(context)
+        await client.request(method, url, **kwargs)
+
+    latencies, statuses = [], Counter()
+    # 先生成全部请求, 请求参数不受并发调度顺序影响
+    pending = [build(context) for _ in range(requests)]
+    pending.reverse()
+
+    async def worker():
+        while pending:
+            method, url, kwargs = pending.pop()
+            start = time.perf_counter()
+            try:
+                status = (await client.request(method, url, **kwargs)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(status)] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "rps": round(requests / elapsed, 1),
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "mean": round(sum(latencies) / len(latencies), 2),
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+async def run(args, workdir, db_path):
+    volumes = read_volumes(db_path)
+    port = free_port()
+    process = start_server(workdir, db_path, port, args.workers)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await wait_ready(client, process)
+
+            # 检查场景覆盖全部路由
+            paths = (await client.get("/openapi.json")).json()["paths"]
+            covered = {build(Context(volumes, ["x"], b"", 0))[1] for build in SCENARIOS.values()}
+            uncovered = sorted(set(paths) - covered)
+            if uncovered:
+                print(f"WARNING: routes without a scenario: {uncovered}")
+
+            tokens = []
+            for user_id in random.Random(2).sample(range(1, volumes["users"] + 1), 20):
+                response = await client.post("/ballkeeper/login/", json={"username": f"user{user_id}", "password": "pw"})
+                tokens.append(response.json()["token"])
+            context = Context(volumes, tokens, test_image(), int(time.time()))
+
+            results = {}
+            names = args.only or list(SCENARIOS)
+            for name in names:
+                results[name] = await run_scenario(
+                    client, context, SCENARIOS[name], args.requests, args.concurrency, args.warmup
+                )
+                result = results[name]
+                print(f"{name:<24}{result['rps']:>9.1f}/s  p50 {result['p50']:>8.2f}  p95 {result['p95']:>8.2f}"
+                      f"  p99 {result['p99']:>8.2f}ms  {result['statuses']}")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return {
+        "meta": {
+            "volumes": volumes,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "uncovered": uncovered,
+        "endpoints": results,
+    }
+
+
+def compare(result, baseline, threshold, min_delta):
+    """返回退化的路由说明"""
+    regressions = []
+    for name, current in result["endpoints"].items():
+        errors = sum(count for status, count in current["statuses"].items() if not status.startswith(("2", "3", "4")))
+        if errors:
+            regressions.append(f"{name}: {errors} server error(s) {current['statuses']}")
+        base = baseline["endpoints"].get(name)
+        # p50和p95同时变慢才视为退化, 单独的尾延迟波动不算
+        if base and all(current[p] > base[p] * threshold and current[p] - base[p] > min_delta for p in ("p50", "p95")):
+            regressions.append(f"{name}: p50 {base['p50']}ms -> {current['p50']}ms, p95 {base['p95']}ms -> {current['p95']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="seed.py生成的数据库, 测试在副本上进行")
+    parser.add_argument("--requests", type=int, default=300, help="每个路由的请求数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker数")
+    parser.add_argument("--warmup", type=int, default=10, help="每个路由不计入统计的预热请求数")
+    parser.add_argument("--only", nargs="*", choices=list(SCENARIOS), help="只测试指定路由")
+    parser.add_argument("--output", help="结果JSON文件, 为空时不保存")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="将结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=1.5, help="p50/p95退化倍数")
+    parser.add_argument("--min-delta", type=float, default=5.0, help="延迟增加不超过该值(毫秒)时不视为退化")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ballkeeper_load_")
+    db_path = os.path.join(workdir, "ballkeeper.db")
+    shutil.copy(args.db, db_path)
+    try:
+        result = asyncio.run(run(args, workdir, db_path))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(result, baseline, args.threshold, args.min_delta)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    print(f"compared with {args.baseline}: {len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+'''
+负载测试数据
+
+在指定的SQLite数据库中按规模写入用户、球队、联赛、活动、关注和报名数据, 建立全文索引并回填报名人数.
+表结构由 init_db 创建, 数据直接用sqlite3批量写入. 随机种子固定, 相同参数生成的数据相同
+
+用法:
+    python benchmarks/load/seed.py --db /tmp/ballkeeper_load.db [--users 100000] [--teams 10000] [--leagues 1000]
+        [--activities 50000] [--signups 1000000] [--follows 5] [--seed 1]
+'''
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src")
+
+# 名称中的中文词, 用于搜索
+WORDS = ["红队", "蓝队", "猛虎", "雄鹰", "闪电", "星辰", "飓风", "烈火", "足球", "篮球", "周末", "联赛"]
+CREATE_TIME = "2026-01-01 00:00:00.000000"
+START_TIME = 1767225600  # 2026-01-01
+BATCH = 50000
+
+
+def image_path(image_type, i):
+    """与上传图片相同格式的内容哈希路径(记录了64/256两个变体), 使 pick_variant 返回尺寸变体"""
+    digest = hashlib.sha256(f"{image_type}{i}".encode('utf8')).hexdigest()[:32]
+    return f"/images/{digest[:2]}/{digest[2:4]}/{image_type}_{digest}_v64-256.png"
+
+
+def name(rng, prefix, i):
+    return f"{prefix}{i} {rng.choice(WORDS)}{rng.choice(WORDS)}"
+
+
+def insert(conn, table, columns, rows):
+    """分批executemany写入"""
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.executemany(statement, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(statement, batch)
+
+
+def seed(conn, args):
+    rng = random.Random(args.seed)
+    timings = {}
+
+    def step(label, fn):
+        start = time.perf_counter()
+        fn()
+        timings[label] = time.perf_counter() - start
+        print(f"{label}: {timings[label]:.1f}s")
+
+    step("users", lambda: insert(conn, "users", (
+        "id", "username", "avatar_path", "gender", "mobile", "team_id", "create_time", "password"
+    ), (
+        (i, f"user{i}", image_path("avatar", i), i % 3, f"138{i:08d}", None, CREATE_TIME, "pw")
+        for i in range(1, args.users + 1)
+    )))
+    step("teams", lambda: insert(conn, "teams", (
+        "id", "name", "team_type", "is_public", "mobile", "content", "creator_id", "logo_path"
+    ), (
+        (i, name(rng, "team", i), i % 3, 1, "", f"{rng.choice(WORDS)}球队简介", rng.randint(1, args.users),
+         image_path("team", i))
+        for i in range(1, args.teams + 1)
+    )))
+    step("leagues", lambda: insert(conn, "leagues", (
+        "id", "name", "league_type_ind", "mobile", "content", "creator_id", "cover_path"
+    ), (
+        (i, name(rng, "league", i), i % 3, "", f"{rng.choice(WORDS)}联赛简介", rng.randint(1, args.users),
+         image_path("league", i))
+        for i in range(1, args.leagues + 1)
+    )))
+    conn.execute("INSERT INTO user_leagues (user_id, league_id, role) SELECT creator_id, id, 'creator' FROM leagues")
+    step("activities", lambda: insert(conn, "activities", (
+        "id", "name", "type_id", "mobile", "address", "content", "creator_id", "team_id", "max_attend",
+        "cover_path", "start_time", "attend_count", "pending_count", "absent_count"
+    ), (
+        (i, name(rng, "activity", i), i % 3, "", None, f"{rng.choice(WORDS)}活动", rng.randint(1, args.users),
+         rng.randint(1, args.teams), rng.choice((0, 0, 0, 50, 100)), image_path("activity", i),
+         START_TIME + i * 600 + rng.randint(0, 599), 0, 0, 0)
+        for i in range(1, args.activities + 1)
+    )))
+
+    def follows():
+        for user_id in range(1, args.users + 1):
+            for n, team_id in enumerate(rng.sample(range(1, args.teams + 1), min(args.follows, args.teams))):
+                yield user_id, team_id, f"2026-01-01 00:{n:02d}:{user_id % 60:02d}.000000", "member"
+    step("user_teams", lambda: insert(conn, "user_teams", ("user_id", "team_id", "follow_time", "role"), follows()))
+
+    def signups():
+        per_activity, extra = divmod(args.signups, args.activities)
+        for activity_id in range(1, args.activities + 1):
+            count = min(per_activity + (activity_id <= extra), args.users)
+            for user_id in rng.sample(range(1, args.users + 1), count):
+                yield activity_id, user_id, rng.randint(1, 3), START_TIME + rng.randint(0, 86400)
+    step("activity_users", lambda: insert(conn, "activity_users", (
+        "activity_id", "user_id", "signup_type", "create_time"
+    ), signups()))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="SQLite数据库文件, 已存在时覆盖")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--teams", type=int, default=10000)
+    parser.add_argument("--leagues", type=int, default=1000)
+    parser.add_argument("--activities", type=int, default=50000)
+    parser.add_argument("--signups", type=int, default=1000000)
+    parser.add_argument("--follows", type=int, default=5, help="每个用户关注的球队数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.db)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    # 用服务相同的init_db建表、迁移、创建全文索引表
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.path.append(SRC_DIR)
+    from db.database import init_db, engine
+    from db.search import SEARCH_TABLES, ENTITY_TYPES
+    from db.migrations import count_signups
+    from constants import SignupType
+    init_db()
+    engine.dispose()
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    seed(conn, args)
+
+    step_start = time.perf_counter()
+    for index_name, (_, prepare) in SEARCH_TABLES.items():
+        # 与服务写入索引时相同的文字处理(中日韩字符单字切分等)
+        conn.create_function("prepare", 1, prepare, deterministic=True)
+        for code, model in ENTITY_TYPES.values():
+            conn.execute(
+                f"INSERT INTO {index_name} (rowid, name, content)"
+                f" SELECT id * 8 + {code}, prepare(name), prepare(content) FROM {model.__tablename__}"
+            )
+    conn.execute(
+        f"UPDATE activities SET attend_count = {count_signups(SignupType.ATTENDING)},"
+        f" pending_count = {count_signups(SignupType.PENDING)},"
+        f" absent_count = {count_signups(SignupType.ABSENT)}"
+    )
+    conn.execute("COMMIT")
+    print(f"search index and counters: {time.perf_counter() - step_start:.1f}s")
+
+    # 合并WAL, 数据库为单个文件, 便于复制
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    print(f"seeded {path} ({os.path.getsize(path) / 1024 / 1024:.0f}MB) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+'''
+查询计划检查
+
+在临时数据库上按顺序调用所有路由, 拦截路由执行的每条SELECT语句,
+用 EXPLAIN QUERY PLAN 检查是否存在全表扫描, 存在时以非0状态码退出.
+
+以下情况不视为全表扫描:
+    - 使用索引的扫描(SCAN ... USING [COVERING] INDEX / INTEGER PRIMARY KEY)
+    - FTS虚拟表(SCAN ... VIRTUAL TABLE)
+    - 带LIMIT且无需临时B树排序的扫描: 按存储顺序读取, 读够LIMIT行即停止
+
+用法:
+    python scripts/check_query_plans.py
+'''
+
+import os
+import re
+import sys
+import tempfile
+
+# NOTE: 切换到临时目录, 使相对路径的数据库文件落在临时目录中; 生成的图片也写入临时目录, 不写入项目的images
+os.chdir(tempfile.mkdtemp(prefix="ballkeeper_plan_"))
+os.environ["IMG_DIR"] = os.path.join(os.getcwd(), "images")
+os.environ["IMG_STORAGE"] = "local"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from db.database import async_engine, init_db
+from routers import users, teams, leagues, activities, others, search
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+# (method, url, 参数), 按顺序执行, 后面的请求依赖前面创建的数据; 参数中的user表示以该用户登录后的令牌请求
+SCENARIO = [
+    ('post', '/ballkeeper/register/', {'json': {'username': '张三', 'password': 'pw'}}),
+    ('post', '/ballkeeper/register/', {'json': {'username': 'bob', 'password': 'pw'}}),
+    ('post', '/ballkeeper/login/', {'json': {'username': '张三', 'password': 'pw'}}),
+    ('post', '/ballkeeper/login/', {'json': {'username': 'bob', 'password': 'pw'}}),
+    ('get', '/ballkeeper/get_user/', {'params': {'user_id': 1}}),
+    ('get', '/ballkeeper/get_users_by_ids/', {'params': {'user_ids': [1, 2]}}),
+    ('post', '/ballkeeper/create_team/', {'user': '张三', 'json': {'name': '红队', 'team_type': 1, 'is_public': True, 'mobile': '1'}}),
+    ('get', '/ballkeeper/get_team/', {'params': {'team_id': 1}}),
+    ('get', '/ballkeeper/get_teams_by_ids/', {'params': {'team_ids': [1]}}),
+    ('post', '/ballkeeper/follow_team/', {'user': 'bob', 'json': {'team_id': 1}}),
+    ('get', '/ballkeeper/get_team_list/', {'user': 'bob', 'params': {'keyword': '', 'limit': 1}}),
+    ('get', '/ballkeeper/get_team_list/', {'user': 'bob', 'params': {'keyword': '红', 'limit': 1}}),
+    ('post', '/ballkeeper/create_league/', {'user': '张三', 'json': {'name': '联赛', 'league_type_ind': 1, 'mobile': '1'}}),
+    ('get', '/ballkeeper/get_league/', {'params': {'league_id': 1}}),
+    ('get', '/ballkeeper/get_leagues/', {'params': {'limit': 1}}),
+    ('get', '/ballkeeper/get_my_leagues/', {'user': '张三', 'params': {'limit': 1}}),
+    ('post', '/ballkeeper/create_activity/', {'json': {'name': '周末赛', 'type_id': 1, 'mobile': '1', 'creator_id': 1, 'team_id': 1}}),
+    ('post', '/ballkeeper/signup_act/', {'json': {'act_id': 1, 'user_id': 2, 'signup_type': 1}}),
+    ('post', '/ballkeeper/signup_act_batch/', {'json': {'act_id': 1, 'signups': [{'user_id': 1, 'signup_type': 1}, {'user_id': 2, 'signup_type': 2}]}}),
+    ('get', '/ballkeeper/get_act_users/', {'params': {'act_id': 1}}),
+    ('get', '/ballkeeper/get_activity/', {'params': {'activity_id': 1}}),
+    ('get', '/ballkeeper/get_activities/', {'params': {'limit': 1}}),
+    ('get', '/ballkeeper/get_activities_by_ids/', {'params': {'activity_ids': [1]}}),
+    ('get', '/ballkeeper/get_my_activities/', {'params': {'user_id': 1}}),
+    ('get', '/ballkeeper/search/', {'params': {'keyword': '红'}}),
+]
+
+def find_full_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    details = [row[-1] for row in plan]
+    sorted_in_order = not any('USE TEMP B-TREE' in detail for detail in details)
+    limited = re.search(r'\bLIMIT\b', statement) is not None
+    scans = []
+    for detail in details:
+        match = FULL_SCAN.match(detail)
+        if match and not (limited and sorted_in_order):
+            scans.append(match.group(1))
+    return details, scans
+
+def main():
+    init_db()
+
+    app = FastAPI()
+    for module in (users, teams, leagues, activities, others, search):
+        app.include_router(module.router)
+
+    current = {}
+    failures = []
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def check_plan(connection, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return
+        details, scans = find_full_scans(connection, statement, parameters)
+        if scans:
+            failures.append((current['route'], statement, details))
+
+    tokens = {}
+    with TestClient(app) as client:
+        for method, url, kwargs in SCENARIO:
+            current['route'] = f"{method.upper()} {url}"
+            kwargs = dict(kwargs)
+            user = kwargs.pop('user', None)
+            if user:
+                kwargs['headers'] = {'Authorization': f"Bearer {tokens[user]}"}
+            response = getattr(client, method)(url, **kwargs)
+            if response.status_code != 200:
+                print(f"{current['route']} returned {response.status_code}: {response.text}")
+                return 1
+            if url == '/ballkeeper/login/':
+                tokens[kwargs['json']['username']] = response.json()['token']
+
+    for route, statement, details in failures:
+        print(f"[FULL SCAN] {route}\n  {' '.join(statement.split())}")
+        for detail in details:
+            print(f"    {detail}")
+    print(f"checked {len(SCENARIO)} requests, {len(failures)} full table scan(s)")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
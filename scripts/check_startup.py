@@ -0,0 +1,108 @@
+'''
+启动耗时检查
+
+在临时目录中用全新的Python进程测量:
+    - import: 导入main的耗时(不应执行DDL, 不应加载Pillow)
+    - startup: 执行lifespan启动(数据库初始化)的耗时, 分别测量空数据库和已初始化的数据库
+    - workers: 多个进程同时对空数据库执行启动, 检查文件锁下的数据库初始化没有失败
+任一项的中位数超出预算或检查失败时以非0状态码退出
+
+用法:
+    python scripts/check_startup.py [--runs 5] [--import-budget 2.0] [--startup-budget 1.0] [--workers 4]
+'''
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+# 未设置SECRET_KEY时服务拒绝启动
+ENV = dict(os.environ, SECRET_KEY=os.environ.get("SECRET_KEY", "check-startup"))
+
+# 在子进程中执行, 输出JSON: 导入耗时、启动耗时和导入后是否已加载Pillow
+PROBE = '''
+import sys, time, json, asyncio
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+import main
+imported = time.perf_counter()
+pil_loaded = "PIL" in sys.modules
+
+async def startup():
+    async with main.lifespan(main.app):
+        pass
+
+asyncio.run(startup())
+print(json.dumps({{
+    "import": imported - start,
+    "startup": time.perf_counter() - imported,
+    "pil_loaded": pil_loaded,
+}}))
+'''
+
+
+def probe(cwd):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(src=os.path.abspath(SRC_DIR))],
+        cwd=cwd, env=ENV, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=2.0, help="导入main耗时中位数上限(秒)")
+    parser.add_argument("--startup-budget", type=float, default=1.0, help="启动耗时中位数上限(秒)")
+    parser.add_argument("--workers", type=int, default=4, help="同时启动的进程数")
+    args = parser.parse_args()
+
+    failures = []
+    cold, warm = [], []
+    for _ in range(args.runs):
+        # 每次使用新的空数据库测量首次启动, 再在同一数据库上测量重复启动
+        cwd = tempfile.mkdtemp(prefix="ballkeeper_startup_")
+        cold.append(probe(cwd))
+        warm.append(probe(cwd))
+
+    for name, results in (("cold", cold), ("warm", warm)):
+        import_time = statistics.median(result["import"] for result in results)
+        startup_time = statistics.median(result["startup"] for result in results)
+        print(f"{name}: import {import_time * 1000:.0f}ms, startup {startup_time * 1000:.0f}ms")
+        if import_time > args.import_budget:
+            failures.append(f"{name} import {import_time:.2f}s > {args.import_budget}s")
+        if startup_time > args.startup_budget:
+            failures.append(f"{name} startup {startup_time:.2f}s > {args.startup_budget}s")
+    if any(result["pil_loaded"] for result in cold + warm):
+        failures.append("PIL is loaded when importing main")
+
+    # 多个进程同时对空数据库执行启动
+    cwd = tempfile.mkdtemp(prefix="ballkeeper_workers_")
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", PROBE.format(src=os.path.abspath(SRC_DIR))],
+            cwd=cwd, env=ENV, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        for _ in range(args.workers)
+    ]
+    failed = 0
+    for process in processes:
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            failed += 1
+            print(stderr.strip().splitlines()[-1] if stderr.strip() else f"exit code {process.returncode}")
+    print(f"workers: {args.workers - failed}/{args.workers} started")
+    if failed:
+        failures.append(f"{failed} of {args.workers} concurrent worker(s) failed to start")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
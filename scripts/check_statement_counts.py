@@ -0,0 +1,95 @@
+'''
+SQL语句数检查
+
+在临时数据库上为同一个活动逐步增加报名人数, 记录 get_activity 和 get_act_users 每次请求执行的SQL语句数
+(引擎的 before_cursor_execute 事件). 语句数随报名人数变化(N+1查询)时以非0状态码退出.
+检查时关闭实体缓存, 每次请求都查询数据库
+
+用法:
+    python scripts/check_statement_counts.py [--signups 0,1,5,20,50]
+'''
+
+import os
+import sys
+import argparse
+import tempfile
+
+# NOTE: 切换到临时目录, 使相对路径的数据库文件落在临时目录中, 图片也写入临时目录
+os.chdir(tempfile.mkdtemp(prefix="ballkeeper_statements_"))
+os.environ["IMG_DIR"] = os.path.join(os.getcwd(), "images")
+os.environ["IMG_STORAGE"] = "local"
+os.environ["ENTITY_CACHE_TTL"] = "0"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from db.database import async_engine, init_db
+from routers import users, teams, activities
+
+# 检查的路由: (名称, url, 参数)
+ROUTES = [
+    ('get_activity', '/ballkeeper/get_activity/', {'activity_id': 1}),
+    ('get_act_users', '/ballkeeper/get_act_users/', {'act_id': 1}),
+]
+
+
+def request(client, method, url, **kwargs):
+    response = getattr(client, method)(url, **kwargs)
+    if response.status_code != 200:
+        raise RuntimeError(f"{method.upper()} {url} returned {response.status_code}: {response.text}")
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--signups", default="0,1,5,20,50", help="依次检查的报名人数, 递增")
+    args = parser.parse_args()
+    signups = sorted(int(n) for n in args.signups.split(","))
+
+    init_db()
+
+    app = FastAPI()
+    for module in (users, teams, activities):
+        app.include_router(module.router)
+
+    statements = [0]
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count(connection, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    counts = {name: {} for name, _, _ in ROUTES}
+    with TestClient(app) as client:
+        for i in range(max(signups)):
+            request(client, 'post', '/ballkeeper/register/', json={'username': f'user{i}', 'password': 'pw'})
+        token = request(client, 'post', '/ballkeeper/login/', json={'username': 'user0', 'password': 'pw'})['token']
+        request(client, 'post', '/ballkeeper/create_team/', headers={'Authorization': f"Bearer {token}"},
+                json={'name': '红队', 'team_type': 1, 'is_public': True, 'mobile': '1'})
+        request(client, 'post', '/ballkeeper/create_activity/',
+                json={'name': '周末赛', 'type_id': 1, 'mobile': '1', 'creator_id': 1, 'team_id': 1})
+
+        signed = 0
+        for n in signups:
+            # 报名类型轮流为 1/2/3, 三个分组都有用户
+            batch = [{'user_id': user_id, 'signup_type': user_id % 3 + 1} for user_id in range(signed + 1, n + 1)]
+            if batch:
+                request(client, 'post', '/ballkeeper/signup_act_batch/', json={'act_id': 1, 'signups': batch})
+            signed = n
+            for name, url, params in ROUTES:
+                statements[0] = 0
+                request(client, 'get', url, params=params)
+                counts[name][n] = statements[0]
+
+    failures = []
+    for name, by_signups in counts.items():
+        print(f"{name}: " + ", ".join(f"{n} signup(s) -> {count} statement(s)" for n, count in by_signups.items()))
+        if len(set(by_signups.values())) > 1:
+            failures.append(name)
+    for name in failures:
+        print(f"FAIL: {name} statement count grows with the number of signups")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
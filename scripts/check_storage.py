@@ -0,0 +1,80 @@
+'''
+图片存储检查
+
+对当前配置的图片存储(IMG_STORAGE)执行一次写入、读取、存在性检查, 失败时以非0状态码退出.
+检查写入的对象在结束时删除; 本地存储在 IMG_DIR 下的临时目录中检查(与图片目录相同的文件系统和权限),
+结束时删除整个临时目录, 不在图片目录中留下空的分片目录.
+S3存储可以用本地的MinIO代替:
+    docker run -p 9000:9000 minio/minio server /data
+    (创建存储桶 ballkeeper 并设置为公开读)
+    IMG_STORAGE=s3 S3_BUCKET=ballkeeper S3_ENDPOINT_URL=http://127.0.0.1:9000 \
+    S3_PUBLIC_URL=http://127.0.0.1:9000/ballkeeper AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin \
+    python scripts/check_storage.py
+
+用法:
+    python scripts/check_storage.py
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import urllib.request
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from envs import IMG_STORAGE, IMG_DIR
+from storage import LocalStorage, create_storage
+from utils import get_img_key
+
+
+def main():
+    if IMG_STORAGE == "s3":
+        return check_storage(create_storage())
+    os.makedirs(IMG_DIR, exist_ok=True)
+    root_dir = tempfile.mkdtemp(prefix=".check_storage_", dir=IMG_DIR)
+    try:
+        return check_storage(LocalStorage(root_dir))
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+
+def check_storage(storage):
+    data = f"ballkeeper storage check {time.time()}".encode('utf8')
+    key = get_img_key("check", ".txt", data)
+    print(f"storage: {IMG_STORAGE}, key: {key}")
+
+    if storage.exists(key):
+        print("FAIL: key exists before save")
+        return 1
+    try:
+        return check(storage, key, data)
+    finally:
+        storage.delete(key)
+        if storage.exists(key):
+            print(f"WARN: failed to delete {key}")
+
+
+def check(storage, key, data):
+    storage.save(key, data)
+    if not storage.exists(key):
+        print("FAIL: key does not exist after save")
+        return 1
+
+    url = storage.url(key)
+    if url.startswith('http'):
+        with urllib.request.urlopen(url) as response:
+            body = response.read()
+    else:
+        with open(storage.path(key), "rb") as f:
+            body = f.read()
+    if body != data:
+        print(f"FAIL: {url} content mismatch")
+        return 1
+    print(f"OK: {url}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+'''
+登录令牌
+
+login 签发带过期时间的HMAC签名令牌, 令牌中包含用户id、用户名和角色,
+需要登录的接口通过 current_user 依赖在内存中校验令牌, 不需要查询数据库.
+
+令牌格式: base64url(JSON载荷).base64url(HMAC-SHA256签名), 请求头: Authorization: Bearer <令牌>
+未携带令牌时返回401; 开启 AUTH_ALLOW_USERNAME(默认关闭)时退回到按username参数查询用户(兼容旧版客户端)
+'''
+
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from typing import NamedTuple, Optional
+from fastapi import Body, Depends, Header, HTTPException, Query
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+from envs import SECRET_KEY, TOKEN_TTL, AUTH_ALLOW_USERNAME
+from db.models import User
+from db.database import get_session
+
+logger = logging.getLogger("ballkeeper")
+
+_secret = SECRET_KEY.encode('utf8')
+
+# 普通用户角色, 目前所有用户都是该角色
+ROLE_USER = "user"
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+    role: str
+
+def check_secret_key():
+    """
+    启动时检查签名密钥
+
+    未设置时各worker进程的密钥不同, 令牌只在签发的进程中有效, 重启后全部失效, 因此拒绝启动
+    """
+    if not SECRET_KEY:
+        raise RuntimeError("SECRET_KEY is not set, refusing to start: tokens would not be valid across workers or restarts")
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+def create_token(user: User, role: str = ROLE_USER, ttl: int = TOKEN_TTL) -> str:
+    """签发令牌"""
+    claims = {'sub': user.id, 'name': user.username, 'role': role, 'exp': int(time.time()) + ttl}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':'), ensure_ascii=False).encode('utf8'))
+    return f"{payload}.{_sign(payload)}"
+
+def verify_token(token: str) -> CurrentUser:
+    """
+    校验令牌的签名和有效期
+
+    Raises:
+        HTTPException: 令牌无效或已过期时返回401
+    """
+    try:
+        payload, signature = token.split('.')
+        # NOTE: 按字节比较, compare_digest比较含非ASCII字符的str时抛出TypeError
+        if not hmac.compare_digest(signature.encode('utf8'), _sign(payload).encode('ascii')):
+            raise ValueError("bad signature")
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError) as e:
+        logger.debug(f"invalid token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if claims['exp'] < time.time():
+        raise HTTPException(status_code=401, detail="Token expired")
+    return CurrentUser(claims['sub'], claims['name'], claims['role'])
+
+async def authenticate(authorization: Optional[str], username: Optional[str], session: AsyncSession) -> CurrentUser:
+    """优先使用Authorization请求头中的令牌, 没有令牌时按username查询用户"""
+    if authorization:
+        scheme, _, token = authorization.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return verify_token(token)
+
+    if not AUTH_ALLOW_USERNAME or not username:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        user = (await session.exec(select(User).where(User.username == username))).first()
+    except SQLAlchemyError as e:
+        logger.error(f"Database operation error: {e}")
+        raise HTTPException(status_code=500, detail="Database operation failed")
+    if not user:
+        raise HTTPException(status_code=401, detail="User does not exist")
+    return CurrentUser(user.id, user.username, ROLE_USER)
+
+def current_user(name: str = 'username', body: bool = False):
+    """
+    当前登录用户的依赖
+
+    Args:
+        name: 兼容旧版客户端的用户名参数名
+        body: 用户名参数在请求体(True)还是查询参数(False)中
+
+    Returns:
+        返回 CurrentUser 的依赖函数
+    """
+    param = Body(None, alias=name) if body else Query(None, alias=name)
+
+    async def dependency(
+        authorization: Optional[str] = Header(None),
+        username: Optional[str] = param,
+        session: AsyncSession = Depends(get_session)
+    ) -> CurrentUser:
+        return await authenticate(authorization, username, session)
+
+    return dependency
@@ -0,0 +1,98 @@
+'''
+实体缓存
+
+get_user、get_team、get_league、get_activity 的结果按(实体类型, id)缓存在进程内,
+条目过期时间(TTL)和数量上限(LRU淘汰)可配置. 本进程内的写操作提交后主动删除受影响的条目,
+嵌入了其他实体数据的条目(如活动中的创建者、球队、报名用户)在写入时登记依赖, 被依赖的实体失效时一并删除;
+多worker部署时各进程的缓存相互独立, 其他进程的写入由TTL保证最多 ENTITY_CACHE_TTL 秒后可见
+'''
+
+import time
+import threading
+from collections import OrderedDict
+from envs import ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL
+from metrics import Counter
+
+CACHE_EVENTS = Counter('entity_cache_events_total', 'Entity cache hits, misses, evictions and invalidations', ('event',))
+
+class TTLCache:
+    """
+    带过期时间的LRU缓存
+
+    Args:
+        maxsize: 条目数上限
+        ttl: 条目有效期(秒), 为0时不缓存
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # 键 -> (过期时间, 值, 依赖的键)
+        self._items = OrderedDict()
+        # 被依赖的键 -> 依赖它的键
+        self._dependents = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        """删除条目并清理其依赖登记, 需在锁内调用"""
+        item = self._items.pop(key, None)
+        if item is None:
+            return False
+        for dependency in item[2]:
+            dependents = self._dependents.get(dependency)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[dependency]
+        return True
+
+    def get(self, key):
+        """返回缓存的值, 不存在或已过期时返回None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                expire_at, value, _ = item
+                if expire_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    CACHE_EVENTS.inc(event='hit')
+                    return value
+                self._remove(key)
+        CACHE_EVENTS.inc(event='miss')
+        return None
+
+    def set(self, key, value, depends_on=()):
+        """
+        缓存值
+
+        Args:
+            depends_on: 值中嵌入了数据的其他键, 其中任一键失效(invalidate)时该条目一并删除
+        """
+        if self.ttl <= 0:
+            return
+        depends_on = frozenset(depends_on)
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (time.monotonic() + self.ttl, value, depends_on)
+            for dependency in depends_on:
+                self._dependents.setdefault(dependency, set()).add(key)
+            while len(self._items) > self.maxsize:
+                self._remove(next(iter(self._items)))
+                CACHE_EVENTS.inc(event='eviction')
+
+    def invalidate(self, *keys):
+        """删除条目, 以及依赖这些键的条目"""
+        with self._lock:
+            pending = list(keys)
+            while pending:
+                key = pending.pop()
+                pending.extend(self._dependents.pop(key, ()))
+                if self._remove(key):
+                    CACHE_EVENTS.inc(event='invalidation')
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._dependents.clear()
+
+# 实体缓存, 键为(实体类型, id), 值为可直接返回的响应数据
+entity_cache = TTLCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
@@ -0,0 +1,28 @@
+'''
+批量接口
+
+批量接口用一次 IN (...) 查询校验/获取请求中的全部实体, 单次请求的数量不超过 MAX_BATCH_SIZE
+'''
+
+from fastapi import HTTPException
+from sqlmodel import select
+from envs import MAX_BATCH_SIZE
+
+def check_batch_size(items):
+    if not items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch size exceeds {MAX_BATCH_SIZE}")
+
+async def fetch_by_ids(session, model, ids):
+    """
+    按id列表获取实体
+
+    Returns:
+        (按请求顺序排列的实体列表(已去重), 不存在的id列表)
+    """
+    check_batch_size(ids)
+    ids = list(dict.fromkeys(ids))
+    rows = (await session.exec(select(model).where(model.id.in_(ids)))).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id], [i for i in ids if i not in by_id]
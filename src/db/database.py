@@ -1,23 +1,109 @@
-from sqlmodel import SQLModel, Session, create_engine
-from envs import DATABASE_URL
+import os
+import time
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from envs import (
+    DATABASE_URL, ASYNC_DATABASE_URL,
+    DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_TEMP_STORE,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW
+)
+from db.search import init_search_index
+from db.migrations import migrate
 import logging
 
-# 创建数据库引擎
-engine = create_engine(DATABASE_URL)
+try:
+    import fcntl
+except ImportError:
+    # Windows不支持fcntl, 开发环境单进程启动时不加锁
+    fcntl = None
+
+# 每个连接建立时设置的SQLite pragma
+SQLITE_PRAGMAS = {
+    "journal_mode": DB_JOURNAL_MODE,
+    "synchronous": DB_SYNCHRONOUS,
+    "busy_timeout": DB_BUSY_TIMEOUT,
+    "cache_size": DB_CACHE_SIZE,
+    "mmap_size": DB_MMAP_SIZE,
+    "temp_store": DB_TEMP_STORE,
+}
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+def create_db_engine(url, is_async=False):
+    """
+    创建数据库引擎
+
+    SQLite连接建立时设置 SQLITE_PRAGMAS, 文件数据库使用可配置大小的连接池
+
+    Args:
+        url: 数据库连接串
+        is_async: 是否创建异步引擎
+    """
+    kwargs = {}
+    # 内存数据库使用单连接池, 不支持连接池参数
+    if ":memory:" not in url:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+
+    if is_async:
+        db_engine = create_async_engine(url, **kwargs)
+        sync_engine = db_engine.sync_engine
+    else:
+        db_engine = sync_engine = create_engine(url, **kwargs)
+
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+# 创建数据库引擎(同步引擎仅用于建表等DDL操作)
+engine = create_db_engine(DATABASE_URL)
+
+# 创建异步数据库引擎(路由中的查询均使用异步引擎, 避免阻塞事件循环)
+async_engine = create_db_engine(ASYNC_DATABASE_URL, is_async=True)
 
 # 依赖项 - 获取数据库会话
-def get_session():
-    with Session(engine) as session:
+async def get_session():
+    # NOTE: expire_on_commit=False, 避免commit后访问属性时触发隐式IO
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
         try:
             yield session
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             logging.error(f"Database session error: {e}")
             raise
-        finally:
-            session.close()
 
 # 初始化数据库
 def init_db():
     """初始化数据库表结构"""
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    # NOTE: 导入模型, 使所有表注册到SQLModel.metadata
+    import db.models  # noqa: F401
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    init_search_index(engine)
+
+def init_db_locked():
+    """
+    在文件锁内初始化数据库
+
+    多个worker同时启动时依次执行init_db, 后执行的worker只做存在性检查, 不会并发执行DDL.
+    锁文件与SQLite数据库文件放在同一目录; 内存数据库或不支持fcntl时不加锁
+    """
+    database = make_url(DATABASE_URL).database
+    if fcntl is None or not database or database == ":memory:":
+        init_db()
+        return
+
+    start = time.perf_counter()
+    with open(f"{os.path.abspath(database)}.init.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            init_db()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    logging.getLogger("ballkeeper").info(f"database initialized in {(time.perf_counter() - start) * 1000:.1f}ms")
@@ -0,0 +1,76 @@
+'''
+数据库迁移
+
+create_all只会创建缺失的表, 无法为已有数据库补充索引和字段.
+迁移按版本号顺序执行, 数据库当前版本记录在SQLite的 PRAGMA user_version 中,
+每个版本在同一个事务中执行并更新版本号. 新建的数据库由create_all按models建好后,
+同样会执行一遍迁移, 因此迁移语句需可重复执行(IF NOT EXISTS 等).
+SQLite的 ADD COLUMN 不支持 IF NOT EXISTS, 加字段使用 add_column 生成的步骤
+'''
+
+import logging
+from sqlalchemy import text
+from constants import SignupType
+
+logger = logging.getLogger("ballkeeper")
+
+def add_column(table, column, definition):
+    """字段不存在时添加字段的迁移步骤"""
+    def step(connection):
+        columns = [row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))]
+        if column not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    return step
+
+def count_signups(signup_type):
+    return (
+        f"(SELECT count(*) FROM activity_users"
+        f" WHERE activity_users.activity_id = activities.id AND activity_users.signup_type = {int(signup_type)})"
+    )
+
+# (版本号, 说明, 步骤列表), 步骤为sql语句或接收connection的函数, 版本号递增, 已发布的迁移不要修改
+MIGRATIONS = [
+    (1, "indexes for hot join tables", [
+        # follow_team 的存在性检查
+        "CREATE INDEX IF NOT EXISTS ix_user_teams_user_team ON user_teams (user_id, team_id)",
+        # get_team_list 按关注时间分页
+        "CREATE INDEX IF NOT EXISTS ix_user_teams_user_follow ON user_teams (user_id, follow_time, id)",
+        "CREATE INDEX IF NOT EXISTS ix_user_leagues_user_league ON user_leagues (user_id, league_id)",
+        "CREATE INDEX IF NOT EXISTS ix_activities_team_id ON activities (team_id)",
+        # get_activities 按开始时间分页
+        "CREATE INDEX IF NOT EXISTS ix_activities_start_time_id ON activities (start_time, id)",
+        # get_act_users 按报名时间排序
+        "CREATE INDEX IF NOT EXISTS ix_activity_users_activity_create ON activity_users (activity_id, create_time)",
+    ]),
+    (2, "signup counters on activities", [
+        add_column("activities", "attend_count", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("activities", "pending_count", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("activities", "absent_count", "INTEGER NOT NULL DEFAULT 0"),
+        # 按已有报名记录回填
+        f"UPDATE activities SET attend_count = {count_signups(SignupType.ATTENDING)},"
+        f" pending_count = {count_signups(SignupType.PENDING)},"
+        f" absent_count = {count_signups(SignupType.ABSENT)}",
+    ]),
+]
+
+def get_version(connection):
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+def migrate(engine):
+    """执行所有未执行的迁移"""
+    with engine.connect() as connection:
+        version = get_version(connection)
+
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        logger.info(f"migrating database: {version} -> {target} ({description})")
+        with engine.begin() as connection:
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(text(statement))
+            # PRAGMA不支持参数绑定
+            connection.execute(text(f"PRAGMA user_version = {int(target)}"))
+        version = target
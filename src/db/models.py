@@ -26,6 +26,12 @@ class UserTeam(SQLModel, table=True):
     follow_time: datetime = Field(default_factory=datetime.utcnow)
     role: str = Field(default="member")  # 可以是 "creator", "admin", "member" 等
 
+    # NOTE: 索引名与 db/migrations.py 中保持一致, 已有数据库通过迁移补建
+    __table_args__ = (
+        sqlalchemy.Index("ix_user_teams_user_team", "user_id", "team_id"),
+        sqlalchemy.Index("ix_user_teams_user_follow", "user_id", "follow_time", "id"),
+    )
+
 # 添加 Team 模型
 class Team(SQLModel, table=True):
     __tablename__ = "teams"
@@ -64,6 +70,10 @@ class UserLeague(SQLModel, table=True):
     league_id: int = Field(foreign_key="leagues.id")
     role: str = Field(default="creator")  # 可以是 "creator", "admin", "member" 等
 
+    __table_args__ = (
+        sqlalchemy.Index("ix_user_leagues_user_league", "user_id", "league_id"),
+    )
+
 class Activity(SQLModel, table=True):
     __tablename__ = "activities"
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -73,14 +83,27 @@ class Activity(SQLModel, table=True):
     address: Optional[str] = None
     content: Optional[str] = None
     creator_id: int = Field(index=True)
-    team_id: Optional[int] = None
+    team_id: Optional[int] = Field(default=None, index=True)
     max_attend: int = Field(default=0)
     cover_path: Optional[str] = None
     start_time: int = Field(default=0)
+    # 各报名类型的人数, 由signup_act在同一事务中维护
+    attend_count: int = Field(default=0)
+    pending_count: int = Field(default=0)
+    absent_count: int = Field(default=0)
+
+    __table_args__ = (
+        sqlalchemy.Index("ix_activities_start_time_id", "start_time", "id"),
+    )
 
     def __str__(self):
         return f"Activity(id={self.id}, name='{self.name}')"
 
+class SignupItem(SQLModel):
+    """批量报名中的一项"""
+    user_id: int
+    signup_type: int
+
 class ActivityUser(SQLModel, table=True):
     __tablename__ = "activity_users"
     activity_id: int = Field(primary_key=True, foreign_key="activities.id")
@@ -91,4 +114,5 @@ class ActivityUser(SQLModel, table=True):
     # 添加联合唯一约束
     __table_args__ = (
         sqlalchemy.UniqueConstraint("activity_id", "user_id", name="uix_activity_user"),
+        sqlalchemy.Index("ix_activity_users_activity_create", "activity_id", "create_time"),
     )
\ No newline at end of file
@@ -0,0 +1,85 @@
+'''
+游标(keyset)分页
+
+按索引列排序, 下一页通过 "排序列 > 上一页最后一行的取值" 定位, 每页都是索引上的范围查询,
+翻到深页和第一页开销相同. 游标是排序列取值的编码, 对客户端不透明, 原样回传即可
+'''
+
+import json
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# 每页条数上限
+MAX_LIMIT = 100
+
+def encode_cursor(values) -> str:
+    """将排序列的取值编码为游标"""
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    解码游标
+
+    Args:
+        cursor: encode_cursor生成的游标
+        size: 排序列个数
+
+    Raises:
+        HTTPException: 游标非法时返回400
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError(f"expect {size} values")
+        values = []
+        for v in payload:
+            # 只接受encode_cursor生成的取值: 数字、字符串和 {'dt': 时间字符串}, 其他值会在绑定SQL参数时出错
+            if isinstance(v, dict):
+                values.append(datetime.fromisoformat(v['dt']))
+            elif isinstance(v, (int, float, str)) and not isinstance(v, bool):
+                values.append(v)
+            else:
+                raise ValueError(f"unexpected value {v!r}")
+        return values
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+def paginate(query, columns, cursor, limit):
+    """
+    为查询添加游标分页条件
+
+    按columns升序排列, 多取一条用于判断是否还有下一页
+
+    Args:
+        query: select语句
+        columns: 排序列, 组合起来需唯一(通常以主键结尾)
+        cursor: 上一页返回的next_cursor, 为空时取第一页
+        limit: 每页条数
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(columns))
+        query = query.where(tuple_(*columns) > tuple_(*values))
+    return query.order_by(*columns).limit(limit + 1)
+
+def page_result(rows, limit, key):
+    """
+    截取一页结果并生成下一页游标
+
+    Args:
+        rows: paginate查询的结果
+        limit: 每页条数
+        key: 从一行结果中取出排序列取值的函数
+
+    Returns:
+        (当前页结果, 下一页游标), 没有下一页时游标为None
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
@@ -0,0 +1,56 @@
+'''
+写事务重试
+
+SQLite同一时刻只允许一个写事务, 并发写入在busy_timeout内仍未拿到写锁时返回 "database is locked".
+run_write 回滚后按指数退避重试整个写事务, 每次等待时间在[0, 退避时间]内随机(full jitter),
+避免同时失败的请求再次同时重试. 重试次数用完后返回503
+'''
+
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from envs import DB_WRITE_RETRIES, DB_WRITE_BACKOFF, DB_WRITE_BACKOFF_MAX
+from metrics import DB_WRITE_LOCKED
+
+logger = logging.getLogger("ballkeeper")
+
+T = TypeVar("T")
+
+def is_locked(e: Exception) -> bool:
+    """是否为SQLite写锁冲突(SQLITE_BUSY/SQLITE_LOCKED)"""
+    return isinstance(e, OperationalError) and "locked" in str(e.orig)
+
+def backoff(attempt: int) -> float:
+    """第attempt次重试前的等待时间(秒)"""
+    return random.uniform(0, min(DB_WRITE_BACKOFF_MAX, DB_WRITE_BACKOFF * 2 ** attempt))
+
+async def run_write(session: AsyncSession, write: Callable[[], Awaitable[T]]) -> T:
+    """
+    执行写事务, 遇到写锁冲突时回滚并重试
+
+    Args:
+        session: 数据库会话
+        write: 执行完整写事务(包括commit)的函数, 重试时会重新执行, 不应包含生成图片等非数据库操作
+
+    Raises:
+        HTTPException: 重试次数用完后仍冲突时返回503
+    """
+    for attempt in range(DB_WRITE_RETRIES + 1):
+        try:
+            return await write()
+        except OperationalError as e:
+            if not is_locked(e):
+                raise
+            await session.rollback()
+            if attempt == DB_WRITE_RETRIES:
+                DB_WRITE_LOCKED.inc(event="exhausted")
+                logger.error(f"database is locked after {attempt} retries: {e}")
+                raise HTTPException(status_code=503, detail="Database is busy, please retry", headers={"Retry-After": "1"})
+            DB_WRITE_LOCKED.inc(event="retry")
+            delay = backoff(attempt)
+            logger.warning(f"database is locked, retry {attempt + 1}/{DB_WRITE_RETRIES} in {delay * 1000:.0f}ms")
+            await asyncio.sleep(delay)
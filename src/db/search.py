@@ -0,0 +1,192 @@
+'''
+全文搜索索引
+
+使用SQLite FTS5为球队、联赛、活动的名称和简介建立倒排索引, 通过ORM事件与业务表保持同步, 共两个索引表:
+    - search_index(unicode61分词): FTS5内置分词器不会切分中文, 写入和查询前将中日韩字符逐字用空格隔开(单字切分),
+      查询时按短语匹配, 效果等同于子串匹配
+    - search_trigram(trigram分词): unicode61按词匹配, "ball" 不能匹配 "football";
+      不含中日韩字符且不少于3个字符的关键词使用三字组索引, 保持子串匹配
+两者都走倒排索引而不是 LIKE '%kw%' 全表扫描
+'''
+
+import re
+import logging
+from sqlalchemy import event, text, table, column, select, func, literal_column, Integer
+from db.models import Team, League, Activity
+
+logger = logging.getLogger("ballkeeper")
+
+SEARCH_TABLE = "search_index"
+# 三字组(trigram)分词的索引表, 用于拉丁字母等不含中日韩字符的关键词的子串匹配
+TRIGRAM_TABLE = "search_trigram"
+# 三字组索引能匹配的最短关键词
+TRIGRAM_MIN_LENGTH = 3
+
+# 实体类型编码, 索引行的rowid = 实体id * 8 + 类型编码, 可按rowid直接定位、删除
+ENTITY_TYPES = {
+    "team": (1, Team),
+    "league": (2, League),
+    "activity": (3, Activity),
+}
+_TYPE_BY_CODE = {code: name for name, (code, _) in ENTITY_TYPES.items()}
+_ROWID_FACTOR = 8
+
+# 中日韩字符
+_CJK_PATTERN = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+
+def segment(value):
+    """中日韩字符逐字切分, 其余文字保持原样交给FTS5分词器"""
+    return _CJK_PATTERN.sub(r' \1 ', value or '')
+
+def _raw(value):
+    return value or ''
+
+# 索引表 -> (分词器, 写入前对文字的处理)
+SEARCH_TABLES = {
+    SEARCH_TABLE: ("unicode61", segment),
+    TRIGRAM_TABLE: ("trigram", _raw),
+}
+
+def _fts(name):
+    """参与sql表达式构建的FTS表, 与表同名的隐藏列用于MATCH"""
+    return table(name, column("rowid", Integer), column(name))
+
+search_index = _fts(SEARCH_TABLE)
+search_trigram = _fts(TRIGRAM_TABLE)
+
+def _rank(index):
+    """bm25相关度(值越小越相关), 名称命中的权重高于简介"""
+    return func.bm25(literal_column(index.name), 10.0, 1.0)
+
+def _quote(phrase):
+    return '"' + phrase.replace('"', '""') + '"'
+
+def match_expr(keyword, column_name=None):
+    """
+    选择索引表, 并将搜索关键词转换为FTS5查询表达式
+
+    - 不含中日韩字符且不少于 TRIGRAM_MIN_LENGTH 个字符: 使用三字组索引, 关键词整体作为短语,
+      匹配任意位置的子串(不区分大小写), 如 "ball" 匹配 "football"
+    - 其他: 使用单字切分的索引, 关键词整体作为短语, 最后一个词按前缀匹配. 中日韩字符逐字切分, 等同于子串匹配;
+      少于3个字符的拉丁字母关键词只匹配词的开头
+
+    Args:
+        keyword: 搜索关键词
+        column_name: 只搜索指定列(name/content), 为空时搜索全部列
+
+    Returns:
+        (索引表, FTS5查询表达式), 关键词为空时返回None
+    """
+    keyword = ' '.join((keyword or '').split())
+    if not keyword:
+        return None
+    if len(keyword) >= TRIGRAM_MIN_LENGTH and not _CJK_PATTERN.search(keyword):
+        index, expr = search_trigram, _quote(keyword)
+    else:
+        index, expr = search_index, f"{_quote(' '.join(segment(keyword).split()))} *"
+    return index, (f'{column_name} : {expr}' if column_name else expr)
+
+def entity_rowid(entity_type, entity_id):
+    return entity_id * _ROWID_FACTOR + ENTITY_TYPES[entity_type][0]
+
+def parse_rowid(rowid):
+    """rowid -> (实体类型, 实体id)"""
+    return _TYPE_BY_CODE.get(rowid % _ROWID_FACTOR), rowid // _ROWID_FACTOR
+
+def _type_clause(index, entity_type):
+    """只保留指定实体类型的条件"""
+    return index.c.rowid % _ROWID_FACTOR == ENTITY_TYPES[entity_type][0]
+
+def search_rowids(keyword, entity_type=None):
+    """
+    匹配关键词的索引行rowid查询, 按相关度排序, 用 parse_rowid 解析
+
+    Args:
+        keyword: 搜索关键词
+        entity_type: 只搜索指定实体类型, 为空时搜索全部类型
+
+    Returns:
+        关键词为空时返回None
+    """
+    match = match_expr(keyword)
+    if match is None:
+        return None
+    index, expr = match
+    query = select(index.c.rowid).where(index.c[index.name].match(expr))
+    if entity_type:
+        query = query.where(_type_clause(index, entity_type))
+    return query.order_by(_rank(index))
+
+def match_ids(entity_type, keyword, column_name=None):
+    """
+    匹配关键词的实体id子查询, 用于 Model.id.in_(...)
+
+    Returns:
+        关键词为空时返回None
+    """
+    match = match_expr(keyword, column_name)
+    if match is None:
+        return None
+    index, expr = match
+    return (
+        select(index.c.rowid // _ROWID_FACTOR)
+        .where(index.c[index.name].match(expr))
+        .where(_type_clause(index, entity_type))
+    )
+
+def _index_entity(connection, entity_type, target):
+    rowid = entity_rowid(entity_type, target.id)
+    for name, (_, prepare) in SEARCH_TABLES.items():
+        connection.execute(text(f"DELETE FROM {name} WHERE rowid = :rowid"), {"rowid": rowid})
+        connection.execute(
+            text(f"INSERT INTO {name}(rowid, name, content) VALUES (:rowid, :name, :content)"),
+            {"rowid": rowid, "name": prepare(target.name), "content": prepare(target.content)}
+        )
+
+def _unindex_entity(connection, entity_type, target):
+    for name in SEARCH_TABLES:
+        connection.execute(
+            text(f"DELETE FROM {name} WHERE rowid = :rowid"),
+            {"rowid": entity_rowid(entity_type, target.id)}
+        )
+
+def _register_events(entity_type, model):
+    @event.listens_for(model, "after_insert")
+    @event.listens_for(model, "after_update")
+    def on_save(mapper, connection, target):
+        _index_entity(connection, entity_type, target)
+
+    @event.listens_for(model, "after_delete")
+    def on_delete(mapper, connection, target):
+        _unindex_entity(connection, entity_type, target)
+
+for _entity_type, (_, _model) in ENTITY_TYPES.items():
+    _register_events(_entity_type, _model)
+
+def init_search_index(engine):
+    """创建FTS表, 首次创建时为已有数据建立索引"""
+    for index_name, (tokenizer, prepare) in SEARCH_TABLES.items():
+        with engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": index_name}
+            ).first()
+            if exists:
+                continue
+
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {index_name} USING fts5(name, content, tokenize = '{tokenizer}')"
+            ))
+            for entity_type, (_, model) in ENTITY_TYPES.items():
+                rows = connection.execute(
+                    text(f"SELECT id, name, content FROM {model.__tablename__}")
+                ).all()
+                if rows:
+                    connection.execute(
+                        text(f"INSERT INTO {index_name}(rowid, name, content) VALUES (:rowid, :name, :content)"),
+                        [
+                            {"rowid": entity_rowid(entity_type, id), "name": prepare(name), "content": prepare(content)}
+                            for id, name, content in rows
+                        ]
+                    )
+                logger.info(f"{index_name} built for {len(rows)} {entity_type}(s)")
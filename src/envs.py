@@ -5,11 +5,117 @@
 import os
 
 # 数据库
-DATABASE_URL = "sqlite:///ballkeeper.db"
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///ballkeeper.db")
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+# 数据库初始化(建表、迁移、全文索引)方式:
+#   startup: 每个worker启动时在文件锁内执行, 多worker依次执行, 不会并发执行DDL
+#   skip: 启动时不执行, 部署时先运行 python src/prestart.py
+DB_INIT = os.environ.get("DB_INIT", "startup")
+
+# SQLite连接参数, 每个连接建立时设置
+# WAL模式下读不阻塞写, 写不阻塞读
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+# WAL模式下NORMAL即可保证数据库一致性, 只在掉电时可能丢失最近的事务
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+# 数据库被锁时的等待时间(毫秒), 超时后才报 "database is locked"
+DB_BUSY_TIMEOUT = int(os.environ.get("DB_BUSY_TIMEOUT", 5000))
+# 页缓存大小, 负数表示KiB
+DB_CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", -20000))
+# 内存映射读取的大小(字节), 0为关闭
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+# 临时表和索引存放位置: DEFAULT/FILE/MEMORY
+DB_TEMP_STORE = os.environ.get("DB_TEMP_STORE", "MEMORY")
+# 连接池
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+# 写事务遇到 "database is locked" 时的重试次数, 及指数退避的初始、最大等待时间(秒)
+DB_WRITE_RETRIES = int(os.environ.get("DB_WRITE_RETRIES", 5))
+DB_WRITE_BACKOFF = float(os.environ.get("DB_WRITE_BACKOFF", 0.05))
+DB_WRITE_BACKOFF_MAX = float(os.environ.get("DB_WRITE_BACKOFF_MAX", 1.0))
 
 # 图片
 # parent dir
 ROOT_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
-IMG_DIR = os.path.join(ROOT_DIR, "images")
+# 本地图片存储目录
+IMG_DIR = os.environ.get("IMG_DIR", os.path.join(ROOT_DIR, "images"))
+
+os.makedirs(IMG_DIR, exist_ok=True)
+
+# 图片处理进程池
+# 进程数, 为0时在线程池中执行
+IMG_WORKERS = int(os.environ.get("IMG_WORKERS", 2))
+# 排队任务数上限, 超出时返回503
+IMG_QUEUE_SIZE = int(os.environ.get("IMG_QUEUE_SIZE", 32))
+
+# 默认图片确定性模式: 颜色由(文字, 尺寸)的哈希决定, 相同文字只渲染、保存一次
+IMG_DETERMINISTIC = os.environ.get("IMG_DETERMINISTIC", "0") == "1"
+# 确定性模式下内存中缓存的默认图片路径数
+IMG_CACHE_SIZE = int(os.environ.get("IMG_CACHE_SIZE", 1024))
+
+# 图片尺寸变体(长边像素), 上传图片和默认图片同时生成各尺寸的缩略图, 格式: "64,256,1024", 为空时不生成
+IMG_VARIANT_SIZES = tuple(sorted(int(size) for size in os.environ.get("IMG_VARIANT_SIZES", "64,256,1024").split(",") if size.strip()))
+
+# 图片存储: local(IMG_DIR) 或 s3(S3兼容的对象存储, 需要安装boto3)
+IMG_STORAGE = os.environ.get("IMG_STORAGE", "local")
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+# S3兼容服务(MinIO等)的地址, 使用AWS S3时为空
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+# 对象key前缀, 如 "images/"
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+# 图片的公开访问地址(存储桶或CDN地址), 返回给客户端的图片URL以此开头
+S3_PUBLIC_URL = os.environ.get("S3_PUBLIC_URL", "")
+
+# /images 静态文件
+# 内容哈希命名的图片的缓存时间(秒)
+IMG_CACHE_MAX_AGE = int(os.environ.get("IMG_CACHE_MAX_AGE", 365 * 24 * 3600))
+# 由nginx发送图片文件时的内部location前缀, 如 "/_images/", 为空时由应用发送
+IMG_ACCEL_REDIRECT = os.environ.get("IMG_ACCEL_REDIRECT", "")
+
+# 上传图片
+# 单个上传文件的大小上限(字节), 超出时返回413
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", 10 * 1024 * 1024))
+# 上传文件写入临时文件时每次读取的字节数
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# 上传图片压缩后的大小上限(字节)
+UPLOAD_IMG_MAX_SIZE = int(os.environ.get("UPLOAD_IMG_MAX_SIZE", 100 * 1024))
+# 上传图片长边上限(像素), 为0时不限制
+UPLOAD_IMG_MAX_DIMENSION = int(os.environ.get("UPLOAD_IMG_MAX_DIMENSION", 2048))
+# 上传图片是否统一转换为WebP
+UPLOAD_IMG_WEBP = os.environ.get("UPLOAD_IMG_WEBP", "0") == "1"
+
+# 日志
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# 日志按日期写入 ballkeeper_YYYY-MM-DD.log, 保留的日志文件天数
+LOG_BACKUP_DAYS = int(os.environ.get("LOG_BACKUP_DAYS", 30))
+# 请求日志默认采样率(0~1)
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+# 按路由设置采样率, 格式: "/ballkeeper/get_activity/=0.1,/ballkeeper/get_user/=0"
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+# 是否记录POST/PUT请求体(DEBUG级别), 及记录的最大字节数
+LOG_BODY = os.environ.get("LOG_BODY", "0") == "1"
+LOG_BODY_MAX = int(os.environ.get("LOG_BODY_MAX", 1024))
+
+# 实体缓存(get_user/get_team/get_league/get_activity)
+# 缓存条目数上限, 超出时淘汰最久未使用的条目
+ENTITY_CACHE_SIZE = int(os.environ.get("ENTITY_CACHE_SIZE", 10000))
+# 缓存有效期(秒), 为0时关闭缓存. 多worker部署时, 其他进程的写入最多在该时间后可见
+ENTITY_CACHE_TTL = float(os.environ.get("ENTITY_CACHE_TTL", 10))
+
+# 批量接口单次请求的最大id/报名数
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 100))
+
+# 登录令牌
+# 签名密钥, 必须设置, 多worker/多实例部署时设置为相同的值; 为空时拒绝启动
+SECRET_KEY = os.environ.get("SECRET_KEY", "")
+# 令牌有效期(秒)
+TOKEN_TTL = int(os.environ.get("TOKEN_TTL", 7 * 24 * 3600))
+# 兼容旧版客户端, 默认关闭: 允许未携带令牌的请求通过username参数认证(任何人都可以冒充其他用户),
+# 并保留GET /ballkeeper/login/(密码在查询参数中). 只在客户端迁移到令牌期间临时开启
+AUTH_ALLOW_USERNAME = os.environ.get("AUTH_ALLOW_USERNAME", "0") == "1"
 
-os.makedirs(IMG_DIR, exist_ok=True)
\ No newline at end of file
+# 按请求的性能分析: 请求头 X-Profile 等于该值时记录cProfile和SQL明细, 为空时关闭(不注册中间件)
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+# 保存的最近分析记录数
+PROFILE_TRACE_SIZE = int(os.environ.get("PROFILE_TRACE_SIZE", 100))
+# 分析记录中保留的函数数(按累计耗时排序)
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", 30))
@@ -0,0 +1,297 @@
+'''
+上传图片压缩
+
+    - 长边超过 max_dimension 的图片先缩小(JPEG解码时直接按比例缩小, 减少解码和编码的像素数);
+      原图未超出大小上限时只编码一次, 缩小后不比原图小则使用原图(去掉EXIF后)
+    - 有损格式(JPEG/WebP)在 [QUALITY_MIN, QUALITY_MAX] 区间查找满足大小上限的最高质量:
+      按已编码的(质量, 大小)对大小取对数插值选择下一个质量, 结果达到上限的 SIZE_TOLERANCE 即停止,
+      通常比逐级降低或二分查找需要更少的编码次数;
+      最低质量仍超限时按面积比例(边长乘以大小比值的平方根)缩小后重新查找
+    - 无损格式(PNG等)直接按面积比例缩小
+    - 缩小 MAX_SCALE_STEPS 次后仍超限时按最后的尺寸再编码一次, 仍超限则记录警告
+    - 按EXIF方向旋转后去掉EXIF(拍摄位置等信息不会被保存), 保留ICC色彩配置;
+      直接使用的原图在不重新编码的情况下删除EXIF数据段(JPEG的APP1、PNG的eXIf块)
+    - 压缩后按 IMG_VARIANT_SIZES 生成比原图小的尺寸变体(make_variants)
+'''
+
+import io
+import os
+import math
+import time
+import logging
+from typing import NamedTuple, Union
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("ballkeeper")
+
+# 扩展名 -> Pillow格式
+FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.webp': 'WEBP',
+    '.gif': 'GIF',
+    '.bmp': 'BMP',
+}
+LOSSY_FORMATS = {'JPEG', 'WEBP'}
+
+QUALITY_MAX = 90
+QUALITY_MIN = 30
+# 查找质量的精度, 区间小于该值, 或结果达到大小上限的 SIZE_TOLERANCE 时停止
+QUALITY_TOLERANCE = 4
+SIZE_TOLERANCE = 0.9
+# 按大小比值缩小时预留的余量, 避免缩小后仍略微超限
+SCALE_MARGIN = 0.95
+# 最多缩小的次数
+MAX_SCALE_STEPS = 4
+# 尺寸变体的编码质量, 变体远小于大小上限, 不需要查找质量
+VARIANT_QUALITY = 80
+# EXIF方向标签
+EXIF_ORIENTATION = 0x0112
+
+class CompressResult(NamedTuple):
+    data: bytes
+    format: str
+    # 编码次数和总耗时(秒)
+    encodes: int
+    elapsed: float
+    # 压缩后的图片尺寸(宽, 高)
+    size: tuple = (0, 0)
+
+def output_extension(file_extension: str, webp: bool = False) -> str:
+    """压缩后图片的扩展名"""
+    if webp:
+        return '.webp'
+    file_extension = file_extension.lower()
+    return file_extension if file_extension in FORMATS else '.png'
+
+def _encode(img, fmt, quality=None, icc_profile=None):
+    output = io.BytesIO()
+    params = {}
+    if icc_profile:
+        params['icc_profile'] = icc_profile
+    if fmt in LOSSY_FORMATS:
+        params['quality'] = quality
+        if fmt == 'JPEG':
+            # 优化哈夫曼表: 体积更小, 耗时基本不变
+            params['optimize'] = True
+        else:
+            params['method'] = 4
+    img.save(output, format=fmt, **params)
+    return output.getvalue()
+
+def _strip_jpeg_exif(data):
+    """删除JPEG中的EXIF段(APP1), 其余数据段和图像数据不变"""
+    output = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        # SOS之后为图像数据
+        if marker == 0xDA:
+            break
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if not (marker == 0xE1 and data[pos + 4:pos + 10] == b'Exif\0\0'):
+            output.append(data[pos:end])
+        pos = end
+    output.append(data[pos:])
+    return b''.join(output)
+
+def _strip_png_exif(data):
+    """删除PNG中的eXIf块, 其余数据块不变"""
+    output = [data[:8]]
+    pos = 8
+    while pos + 8 <= len(data):
+        end = pos + 12 + int.from_bytes(data[pos:pos + 4], 'big')
+        if data[pos + 4:pos + 8] != b'eXIf':
+            output.append(data[pos:end])
+        pos = end
+    return b''.join(output)
+
+STRIP_EXIF = {'JPEG': _strip_jpeg_exif, 'PNG': _strip_png_exif}
+
+def _without_exif(data, img):
+    """
+    不重新编码, 去掉原图中的EXIF
+
+    需要按EXIF方向旋转、格式不支持或去掉后仍有EXIF时返回None, 原图不能直接使用
+    """
+    exif = img.getexif()
+    if not exif:
+        return data
+    if exif.get(EXIF_ORIENTATION, 1) != 1 or img.format not in STRIP_EXIF:
+        return None
+    data = STRIP_EXIF[img.format](data)
+    try:
+        if Image.open(io.BytesIO(data)).getexif():
+            return None
+    except OSError:
+        return None
+    return data
+
+def _prepare(img, fmt, max_dimension):
+    """限制边长, 按EXIF方向旋转, 并转换为目标格式支持的颜色模式"""
+    if max_dimension and max(img.size) > max_dimension:
+        # JPEG解码时按1/2、1/4、1/8缩小, 不会小于请求的尺寸
+        scale = max_dimension / max(img.size)
+        img.draft(img.mode, (int(img.width * scale), int(img.height * scale)))
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    img = ImageOps.exif_transpose(img)
+    if fmt == 'JPEG' and img.mode != 'RGB':
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # 透明背景填充为白色
+            rgba = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')
+    elif fmt == 'WEBP' and img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or img.mode == 'P' else 'RGB')
+    return img
+
+def _next_quality(low, high, max_size):
+    """
+    在(low, high)之间选择下一个质量
+
+    low为满足上限的(质量, 大小), high为超出上限的(质量, 大小),
+    编码大小随质量近似指数增长, 对大小取对数后线性插值
+    """
+    (q_low, size_low), (q_high, size_high) = low, high
+    ratio = math.log(max_size / size_low) / math.log(size_high / size_low)
+    quality = q_low + (q_high - q_low) * ratio
+    return int(min(max(quality, q_low + 1), q_high - 1))
+
+def _scale(img, ratio):
+    """按面积比例缩小, 边长缩放为比例的平方根"""
+    factor = min(1.0, (ratio ** 0.5) * SCALE_MARGIN)
+    size = (max(1, int(img.width * factor)), max(1, int(img.height * factor)))
+    return img.resize(size, Image.LANCZOS)
+
+def compress_image(
+    image_data: Union[bytes, str],
+    file_extension: str,
+    max_size: int = 100 * 1024,
+    webp: bool = False,
+    max_dimension: int = 0
+) -> CompressResult:
+    """
+    压缩图片至指定大小以内
+
+    Args:
+        image_data: 原始图片数据, 或图片文件路径(从文件解码, 不将原图整体读入内存)
+        file_extension: 文件扩展名（带.）如.jpg、.png
+        max_size: 最大文件大小（字节），默认100KB
+        webp: 是否输出为WebP
+        max_dimension: 长边上限(像素), 为0时不限制
+
+    Returns:
+        CompressResult: 压缩后的图片数据、格式、编码次数和耗时
+    """
+    start = time.perf_counter()
+    from_file = isinstance(image_data, str)
+    img_len = os.path.getsize(image_data) if from_file else len(image_data)
+    img = Image.open(image_data if from_file else io.BytesIO(image_data))
+    fmt = FORMATS[output_extension(file_extension, webp)]
+    icc_profile = img.info.get('icc_profile')
+
+    # 大小未超限且格式不变时原图(去掉EXIF后)可以直接使用; 边长也未超限时不解码、不编码
+    original_size = img.size
+    original_data = None
+    if img_len <= max_size and img.format == fmt:
+        if from_file:
+            with open(image_data, "rb") as f:
+                original_data = _without_exif(f.read(), img)
+        else:
+            original_data = _without_exif(image_data, img)
+    if original_data is not None and (not max_dimension or max(img.size) <= max_dimension):
+        return CompressResult(original_data, fmt, 0, time.perf_counter() - start, original_size)
+
+    # 格式不变时用原图大小按面积估算编码后的大小
+    same_format = img.format == fmt
+    area = img.width * img.height
+    img = _prepare(img, fmt, max_dimension)
+    estimate = img_len * img.width * img.height / area if same_format else None
+
+    encodes = 0
+    high = None
+    for _ in range(MAX_SCALE_STEPS + 1):
+        if fmt not in LOSSY_FORMATS:
+            # 无损格式: 按估算或上次编码的大小缩小
+            if estimate and estimate > max_size:
+                img = _scale(img, max_size / estimate)
+            data = _encode(img, fmt, icc_profile=icc_profile)
+            encodes += 1
+            if len(data) <= max_size or (original_data is not None and len(data) >= len(original_data)):
+                break
+            estimate = len(data)
+            continue
+
+        # 先尝试最高质量, 大多数图片一次编码即可满足; 缩小后沿用按面积估算的最高质量大小
+        if high is None:
+            data = _encode(img, fmt, QUALITY_MAX, icc_profile)
+            encodes += 1
+            if len(data) <= max_size or (original_data is not None and len(data) >= len(original_data)):
+                break
+            high = (QUALITY_MAX, len(data))
+        data = _encode(img, fmt, QUALITY_MIN, icc_profile)
+        encodes += 1
+        if len(data) > max_size:
+            area = img.width * img.height
+            img = _scale(img, max_size / len(data))
+            high = (QUALITY_MAX, high[1] * img.width * img.height / area)
+            continue
+
+        # 查找满足上限的最高质量, data始终为已知满足上限的结果
+        low = (QUALITY_MIN, len(data))
+        while high[0] - low[0] > QUALITY_TOLERANCE and len(data) < max_size * SIZE_TOLERANCE:
+            quality = _next_quality(low, high, max_size)
+            candidate = _encode(img, fmt, quality, icc_profile)
+            encodes += 1
+            if len(candidate) <= max_size:
+                low, data = (quality, len(candidate)), candidate
+            else:
+                high = (quality, len(candidate))
+        break
+    else:
+        # 缩小次数用完仍超限: 无损格式按上次编码的大小再缩小一次(有损格式已在最后一步缩小), 以最低质量编码
+        if fmt not in LOSSY_FORMATS:
+            img = _scale(img, max_size / estimate)
+        data = _encode(img, fmt, QUALITY_MIN, icc_profile)
+        encodes += 1
+        if len(data) > max_size:
+            logger.warning(f"image still over size limit after {MAX_SCALE_STEPS} downscales: "
+                           f"{img_len / 1024:.2f}KB -> {len(data) / 1024:.2f}KB, size={img.size}")
+
+    if original_data is not None and len(data) >= len(original_data):
+        # 原图未超出大小上限, 只因边长超限而缩小, 缩小后反而更大(如已高度压缩的截图)时使用原图
+        logger.info(f"kept original image: {len(original_data) / 1024:.2f}KB, "
+                    f"downscaled to {img.size} is {len(data) / 1024:.2f}KB")
+        return CompressResult(original_data, fmt, encodes, time.perf_counter() - start, original_size)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"compressed image: {img_len / 1024:.2f}KB -> {len(data) / 1024:.2f}KB, "
+                f"format={fmt}, size={img.size}, encodes={encodes}, {elapsed * 1000:.1f}ms")
+    return CompressResult(data, fmt, encodes, elapsed, img.size)
+
+def make_variants(image_data: bytes, sizes) -> list:
+    """
+    按长边生成图片的尺寸变体
+
+    Args:
+        image_data: 压缩后的图片数据
+        sizes: 变体长边尺寸, 不小于原图长边的尺寸不生成(不放大, 也不保存原图的副本)
+
+    Returns:
+        list: [(尺寸, 图片数据)]
+    """
+    img = Image.open(io.BytesIO(image_data))
+    fmt = img.format
+    icc_profile = img.info.get('icc_profile')
+    variants = []
+    for size in sizes:
+        if size >= max(img.size):
+            continue
+        variant = img.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+        variants.append((size, _encode(variant, fmt, VARIANT_QUALITY, icc_profile)))
+    return variants
@@ -3,7 +3,13 @@ import random
 import os
 import time
 import secrets
+import hashlib
+from functools import lru_cache
 
+# 最小字号
+MIN_FONT_SIZE = 8
+
+@lru_cache(maxsize=1)
 def get_system_font():
     """获取系统中文字体"""
     # 常见的中文字体路径
@@ -23,6 +29,32 @@ def get_system_font():
 
     return None
 
+@lru_cache(maxsize=128)
+def load_font(font_path, font_size):
+    """加载字体, 按(字体路径, 字号)缓存, LRU淘汰"""
+    return ImageFont.truetype(font_path, font_size)
+
+def fit_font(draw, text, font_path, ref_size, max_width, max_height):
+    """
+    计算使文字恰好放入(max_width, max_height)的字体
+
+    文字尺寸与字号近似成正比, 测量一次参考字号下的尺寸即可按比例算出目标字号,
+    字形度量取整导致略微超出时, 再按比例修正一次, 最多加载3次字体
+    """
+    font_size = ref_size
+    font = load_font(font_path, font_size)
+    for _ in range(2):
+        text_bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+        if text_width <= 0 or text_height <= 0:
+            break
+        if font_size != ref_size and text_width <= max_width and text_height <= max_height:
+            break
+        font_size = max(MIN_FONT_SIZE, int(font_size * min(max_width / text_width, max_height / text_height)))
+        font = load_font(font_path, font_size)
+    return font
+
 def get_contrast_color(bg_color):
     """根据背景色生成对比度高的前景色"""
     # 计算背景色的亮度
@@ -30,35 +62,53 @@ def get_contrast_color(bg_color):
     # 如果背景偏亮，返回黑色；如果背景偏暗，返回白色
     return (0, 0, 0) if brightness > 128 else (255, 255, 255)
 
-def gen_txt_img(text, size=(50, 50)):
+def gen_gradient(size, color1, color2):
+    """生成从上(color1)到下(color2)的竖直渐变图片"""
+    # linear_gradient为从上到下0~255的灰度图, 取一列缩放到目标高度作为混合蒙版,
+    # 一次混合出整列颜色后再横向拉伸, 避免逐行绘制
+    mask = Image.linear_gradient('L').crop((0, 0, 1, 256)).resize((1, size[1]), Image.BILINEAR)
+    column = Image.composite(Image.new('RGB', mask.size, color2), Image.new('RGB', mask.size, color1), mask)
+    return column.resize(size, Image.NEAREST)
+
+def hash_colors(text, size):
+    """由(文字, 尺寸)的哈希确定两个渐变颜色, 相同输入总是得到相同颜色"""
+    digest = hashlib.sha256(f"{text}|{size[0]}x{size[1]}".encode('utf8')).digest()
+    color1 = tuple(b % 151 + 50 for b in digest[0:3])  # 50-200 范围
+    color2 = tuple(b % 151 + 50 for b in digest[3:6])
+    return color1, color2
+
+def random_colors():
+    """随机的两个渐变颜色"""
     # 使用时间戳和随机数组合作为种子
     random.seed(int(time.time() * 1000) + secrets.randbelow(1000000))
-    
+
     # 使用 secrets 模块生成更随机的颜色
     color1 = (
         secrets.randbelow(151) + 50,  # 50-200 范围
         secrets.randbelow(151) + 50,
         secrets.randbelow(151) + 50
     )
-    
+
     color2 = (
         secrets.randbelow(151) + 50,
         secrets.randbelow(151) + 50,
         secrets.randbelow(151) + 50
     )
+    return color1, color2
+
+def gen_txt_img(text, size, colors):
+    """
+    生成渐变背景的文字图片
+
+    Args:
+        colors: 两个渐变颜色(random_colors/hash_colors), 同一图片的不同尺寸使用相同颜色
+    """
+    color1, color2 = colors
 
-    # 创建新图片
-    img = Image.new('RGB', size)
+    # 创建渐变背景图片
+    img = gen_gradient(size, color1, color2)
     draw = ImageDraw.Draw(img)
     
-    # 创建渐变背景
-    for y in range(size[1]):
-        ratio = y / size[1]
-        r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-        g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-        b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-        draw.line([(0, y), (size[0], y)], fill=(r, g, b))
-    
     # 获取中间位置的背景色，用于决定文字颜色
     mid_y = size[1] // 2
     mid_color = (
@@ -75,40 +125,8 @@ def gen_txt_img(text, size=(50, 50)):
     if font_path:
         # 根据文本长度动态调整初始字体大小
         initial_size = size[0] // (len(text) if len(text) > 2 else 2)  # 文字越长，初始字体越小
-        font_size = initial_size
-        font = ImageFont.truetype(font_path, font_size)
-        
-        # 获取文字大小
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        # 调整字体大小直到文字适合图片（宽度不超过70%）
-        max_width = size[0] * 0.8
-        max_height = size[1] * 0.8
-        
-        if text_width > max_width or text_height > max_height:
-            # 如果初始大小太大，就逐步缩小
-            while text_width > max_width or text_height > max_height:
-                font_size = int(font_size * 0.9)  # 每次缩小10%
-                if font_size < 8:  # 设置最小字体大小
-                    font_size = 8
-                    break
-                font = ImageFont.truetype(font_path, font_size)
-                text_bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-        else:
-            # 如果初始大小太小，就逐步放大
-            while text_width < max_width and text_height < max_height:
-                font_size += 1
-                font = ImageFont.truetype(font_path, font_size)
-                text_bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-            # 回退一个字号确保不超出
-            font_size -= 1
-            font = ImageFont.truetype(font_path, font_size)
+        # 调整字体大小直到文字适合图片（宽高不超过80%）
+        font = fit_font(draw, text, font_path, max(initial_size, MIN_FONT_SIZE), size[0] * 0.8, size[1] * 0.8)
     else:
         # 如果没找到中文字体，使用默认字体
         font = ImageFont.load_default()
@@ -131,5 +149,5 @@ def gen_txt_img(text, size=(50, 50)):
 # 使用示例
 if __name__ == "__main__":
     for text in ["aa", "bf", 's']:
-        avatar = gen_txt_img(text)
+        avatar = gen_txt_img(text, (50, 50), random_colors())
         avatar.save(f"{text}.png")
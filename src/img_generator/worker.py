@@ -0,0 +1,145 @@
+'''
+图片处理进程池
+
+生成默认图片(gen_txt_img)和压缩上传图片(compress_image)都是CPU密集型的Pillow操作,
+统一提交到有界进程池中执行, 避免阻塞事件循环, 并能利用多核.
+Pillow相关模块(img_gen、compress)在任务函数中导入, 导入本模块和启动服务时不加载Pillow
+'''
+
+import io
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from envs import (
+    IMG_WORKERS, IMG_QUEUE_SIZE, IMG_DETERMINISTIC, IMG_CACHE_SIZE,
+    UPLOAD_IMG_MAX_SIZE, UPLOAD_IMG_WEBP, UPLOAD_IMG_MAX_DIMENSION
+)
+from utils import get_img_key, get_txt_img_key, get_default_img_key, get_variant_path, recorded_sizes, variant_sizes
+from storage import storage
+from metrics import IMAGE_PROCESSING_DURATION, IMAGE_COMPRESS_ENCODES
+
+logger = logging.getLogger("ballkeeper")
+
+_executor = None
+# 正在执行和排队中的任务数(仅在事件循环线程中读写)
+_pending = 0
+# 确定性默认图片的LRU缓存: (文字, 尺寸) -> 图片路径
+_default_imgs = OrderedDict()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # NOTE: 使用spawn, 避免在已有数据库线程的进程中fork
+        _executor = ProcessPoolExecutor(
+            max_workers=IMG_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"image worker pool started: workers={IMG_WORKERS}, queue_size={IMG_QUEUE_SIZE}")
+    return _executor
+
+async def run_image_task(fn, *args):
+    """
+    提交图片处理任务并等待结果
+
+    Args:
+        fn: 可序列化的顶层函数
+        *args: 函数参数
+
+    Raises:
+        HTTPException: 排队任务数超出上限时返回503
+    """
+    global _pending
+    if _pending >= IMG_WORKERS + IMG_QUEUE_SIZE:
+        logger.warning(f"image worker queue is full, pending: {_pending}")
+        raise HTTPException(status_code=503, detail="Image worker queue is full")
+
+    _pending += 1
+    start = time.perf_counter()
+    try:
+        executor = _get_executor() if IMG_WORKERS > 0 else None
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    finally:
+        _pending -= 1
+        IMAGE_PROCESSING_DURATION.observe(time.perf_counter() - start, task=fn.__name__.lstrip('_'))
+
+def shutdown_image_worker():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+def _save_png(img, key):
+    output = io.BytesIO()
+    img.save(output, format='PNG')
+    storage.save(key, output.getvalue())
+
+def _save_txt_img(text, size, key, colors):
+    from img_generator.img_gen import gen_txt_img
+    # 各尺寸变体使用相同颜色按各自尺寸渲染, 比缩放原图清晰; 渲染key中记录的变体, 默认的50x50图片没有变体
+    for variant_size in recorded_sizes(key):
+        scale = variant_size / max(size)
+        variant = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+        _save_png(gen_txt_img(text, variant, colors=colors), get_variant_path(key, variant_size))
+    # NOTE: 原图最后写入, 原图存在即表示变体已全部生成
+    _save_png(gen_txt_img(text, size, colors=colors), key)
+
+def _exists(key):
+    return storage.exists(key)
+
+async def save_txt_img(text, image_type, size=(50, 50)):
+    """生成文字图片并保存, 返回图片URL"""
+    from img_generator.img_gen import hash_colors, random_colors
+    if not IMG_DETERMINISTIC:
+        # key由(文字, 尺寸, 颜色)的哈希决定, 与图片内容一一对应
+        colors = random_colors()
+        key = get_txt_img_key(image_type, text, size, colors)
+        await run_image_task(_save_txt_img, text, size, key, colors)
+        return storage.url(key)
+
+    # 确定性模式: 相同(文字, 尺寸)的图片只渲染、保存一次
+    cache_key = (text, tuple(size))
+    img_path = _default_imgs.get(cache_key)
+    if img_path:
+        _default_imgs.move_to_end(cache_key)
+        return img_path
+
+    key = get_default_img_key(text, size)
+    # NOTE: S3存储的exists是网络请求, 放到线程池中执行
+    if not await run_in_threadpool(_exists, key):
+        await run_image_task(_save_txt_img, text, size, key, hash_colors(text, size))
+    img_path = storage.url(key)
+
+    _default_imgs[cache_key] = img_path
+    if len(_default_imgs) > IMG_CACHE_SIZE:
+        _default_imgs.popitem(last=False)
+    return img_path
+
+def _compress_image_file(src_path, image_type, file_extension):
+    from img_generator.compress import compress_image, make_variants, output_extension
+    result = compress_image(src_path, file_extension, UPLOAD_IMG_MAX_SIZE, UPLOAD_IMG_WEBP, UPLOAD_IMG_MAX_DIMENSION)
+    sizes = variant_sizes(max(result.size))
+    key = get_img_key(image_type, output_extension(file_extension, UPLOAD_IMG_WEBP), result.data, sizes)
+    # 相同内容的图片已存在时不重复写入
+    if not storage.exists(key):
+        for size, data in make_variants(result.data, sizes):
+            storage.save(get_variant_path(key, size), data)
+        # 原图最后写入, 原图存在即表示变体已全部写入
+        storage.save(key, result.data)
+    # 图片数据已写入存储, 只返回统计信息
+    return result._replace(data=b''), storage.url(key)
+
+async def compress_image_file(src_path: str, image_type: str, file_extension: str):
+    """
+    压缩src_path的图片并以内容哈希命名保存, 同时生成尺寸变体
+
+    Returns:
+        (压缩统计, 图片URL)
+    """
+    result, img_path = await run_image_task(_compress_image_file, src_path, image_type, file_extension)
+    IMAGE_COMPRESS_ENCODES.observe(result.encodes, format=result.format)
+    return result, img_path
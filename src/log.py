@@ -1,15 +1,83 @@
-import logging
 import os
-from datetime import datetime
+import re
+import time
+import queue
+import random
+import atexit
+import logging
+from datetime import date, timedelta
+from logging.handlers import QueueHandler, QueueListener
 
-def create_logger(name: str, log_dir: str, level: str = 'INFO') -> logging.Logger:
+# 后台写日志的线程: [(logger, QueueHandler, QueueListener)], 进程退出或应用关闭时停止
+_listeners = []
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    按日期命名的日志文件: {prefix}_YYYY-MM-DD.log, 日期变化后的第一条日志写入新文件
+
+    只追加写入、不重命名文件, 多个worker进程写入同一个文件是安全的
+    (TimedRotatingFileHandler在每个进程中各自轮转, 会互相删除、覆盖轮转后的文件).
+    切换文件时删除超过backup_days天的日志文件
+
+    Args:
+        log_dir: 日志文件保存目录
+        prefix: 文件名前缀
+        backup_days: 保留的日志文件天数, 为0时不删除
+    """
+
+    def __init__(self, log_dir: str, prefix: str, backup_days: int = 30, encoding: str = 'utf8'):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.backup_days = backup_days
+        self.date = self._date(time.time())
+        super().__init__(self._path(self.date), encoding=encoding)
+        self._remove_expired()
+
+    @staticmethod
+    def _date(timestamp):
+        return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+    def _path(self, day):
+        return os.path.join(self.log_dir, f'{self.prefix}_{day}.log')
+
+    def _remove_expired(self):
+        if self.backup_days <= 0:
+            return
+        expire = (date.today() - timedelta(days=self.backup_days)).isoformat()
+        pattern = re.compile(rf'^{re.escape(self.prefix)}_(\d{{4}}-\d{{2}}-\d{{2}})\.log$')
+        for filename in os.listdir(self.log_dir):
+            match = pattern.match(filename)
+            if match and match.group(1) < expire:
+                try:
+                    os.remove(os.path.join(self.log_dir, filename))
+                except FileNotFoundError:
+                    # 其他worker进程已删除
+                    pass
+
+    def emit(self, record):
+        # NOTE: emit在处理器的锁内执行
+        day = self._date(record.created)
+        if day != self.date:
+            self.date = day
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = self._path(day)
+            self._remove_expired()
+        super().emit(record)
+
+def create_logger(name: str, log_dir: str, level: str = 'INFO', backup_days: int = 30) -> logging.Logger:
     """
     创建一个logger，支持同时输出到文件和控制台
 
+    logger本身只挂一个QueueHandler, 调用方(事件循环线程)只负责入队,
+    文件和控制台的写入由后台QueueListener线程完成, 日志按日期写入 {name}_YYYY-MM-DD.log
+
     Args:
         name: logger名称
         log_dir: 日志文件保存目录
         level: 日志级别，默认INFO
+        backup_days: 保留的历史日志文件数(天)
 
     Returns:
         logging.Logger: 配置好的logger对象
@@ -26,16 +94,21 @@ def create_logger(name: str, log_dir: str, level: str = 'INFO') -> logging.Logge
         datefmt='%Y-%m-%d %H:%M:%S'
     )
 
-    # 创建文件处理器
-    log_file = os.path.join(log_dir, f'{name}_{datetime.now().strftime("%Y-%m-%d")}.log')
-    file_handler = logging.FileHandler(log_file, encoding='utf8')
+    # 创建文件处理器, 按日期写入 {name}_YYYY-MM-DD.log, 多worker进程共用同一天的文件
+    file_handler = DailyFileHandler(log_dir, name, backup_days)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
     # 创建控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+
+    # 创建队列处理器, 由后台线程写入文件和控制台
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    _listeners.append((logger, queue_handler, listener))
 
     # 设置日志级别
     level_map = {
@@ -48,3 +121,34 @@ def create_logger(name: str, log_dir: str, level: str = 'INFO') -> logging.Logge
     logger.setLevel(level_map.get(level.upper(), logging.INFO))
 
     return logger
+
+@atexit.register
+def stop_loggers():
+    """停止后台写日志线程, 写完队列中剩余的日志并关闭日志文件; 再次create_logger时不会重复添加处理器"""
+    while _listeners:
+        logger, queue_handler, listener = _listeners.pop()
+        logger.removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+class RequestLogSampler:
+    """
+    请求日志采样
+
+    Args:
+        default_rate: 默认采样率(0~1)
+        rates: 按路由设置的采样率, 格式: "/path/=0.1,/other/=0"
+    """
+
+    def __init__(self, default_rate: float = 1.0, rates: str = ''):
+        self.default_rate = default_rate
+        self.rates = {}
+        for item in rates.split(','):
+            if '=' in item:
+                path, rate = item.rsplit('=', 1)
+                self.rates[path.strip()] = float(rate)
+
+    def should_log(self, path: str) -> bool:
+        rate = self.rates.get(path, self.default_rate)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
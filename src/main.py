@@ -4,52 +4,102 @@ import os
 # NOTE: 此行代码应在所有导入之前: 添加main所在目录到Python路径
 sys.path.append(os.path.dirname(__file__))
 
-from envs import ROOT_DIR, IMG_DIR
-from log import create_logger
+import time
+import logging
+from contextlib import asynccontextmanager
+from envs import ROOT_DIR, IMG_DIR, DB_INIT, PROFILE_SECRET, LOG_LEVEL, LOG_BACKUP_DAYS, LOG_SAMPLE_RATE, LOG_SAMPLE_RATES, LOG_BODY, LOG_BODY_MAX
+from log import create_logger, stop_loggers, RequestLogSampler
 
-logger = create_logger(name="ballkeeper", level="debug", log_dir=f"{ROOT_DIR}/logs")
+# NOTE: 导入main时不创建日志文件和后台线程, 在lifespan中创建
+logger = logging.getLogger("ballkeeper")
+request_log_sampler = RequestLogSampler(LOG_SAMPLE_RATE, LOG_SAMPLE_RATES)
 
-from db.database import init_db
-from db.models import *
+from typing import Optional
+from fastapi import FastAPI, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from db.database import async_engine, init_db_locked
+from metrics import instrument_engine, track_request, render_metrics
+from routers import users, teams, leagues, activities, others, search
+from img_generator.worker import shutdown_image_worker
+from upload import UploadSizeLimit
+from static import ImageFiles
+from auth import check_secret_key
+import profiling
 
-# 初始化数据库,创建数据库表
-init_db()
+@asynccontextmanager
+async def lifespan(app):
+    # 创建日志文件和后台写日志线程, 应用关闭时停止
+    create_logger(name="ballkeeper", level=LOG_LEVEL, log_dir=f"{ROOT_DIR}/logs", backup_days=LOG_BACKUP_DAYS)
+    # 未设置SECRET_KEY时拒绝启动
+    check_secret_key()
+    # 初始化数据库: 导入main时不执行DDL, 多worker在文件锁内依次执行; DB_INIT=skip时由prestart.py提前执行
+    if DB_INIT != "skip":
+        await run_in_threadpool(init_db_locked)
+    yield
+    # 关闭图片处理进程池
+    shutdown_image_worker()
+    # 写完剩余日志
+    stop_loggers()
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from routers import users, teams, leagues, activities, others
-
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(users.router)
 app.include_router(teams.router)
 app.include_router(leagues.router)
 app.include_router(activities.router)
 app.include_router(others.router)
+app.include_router(search.router)
 
-# 添加调试中间件
+# 添加请求日志中间件
 @app.middleware("http")
 async def log_request_details(request, call_next):
-    # 打印请求方法和URL
-    logger.debug(f"Request method: {request.method}")
-    logger.debug(f"Request URL: {request.url}")
-
-    '''
-    # 打印请求头
-    logger.debug("Request headers:")
-    for header, value in request.headers.items():
-        logger.debug(f"{header}: {value}")
-    '''
-
-    # 打印请求体 (如果是POST/PUT请求)
-    if request.method in ["POST", "PUT"]:
+    # 按路由采样, 未采样的请求不产生任何日志开销
+    if not request_log_sampler.should_log(request.url.path):
+        return await call_next(request)
+
+    # 打印请求体 (如果开启且是POST/PUT请求), 只读取并解码前LOG_BODY_MAX字节, 不读取上传文件
+    if (LOG_BODY and request.method in ["POST", "PUT"] and logger.isEnabledFor(logging.DEBUG)
+            and not request.headers.get("content-type", "").startswith("multipart/")):
         try:
             body = await request.body()
-            logger.debug(f"Request body decode: {body.decode()}")
+            logger.debug(f"Request body decode: {body[:LOG_BODY_MAX].decode(errors='replace')}"
+                         f"{'...' if len(body) > LOG_BODY_MAX else ''}")
         except Exception as e:
             logger.debug(f"Could not read request body: {e}")
 
     # 继续处理请求
+    start = time.perf_counter()
     response = await call_next(request)
+
+    # 打印请求方法、路径、状态码和耗时
+    # NOTE: 不记录查询参数, login等接口的密码在查询参数中
+    logger.info(f"{request.method} {request.url.path} {response.status_code} {(time.perf_counter() - start) * 1000:.1f}ms")
     return response
 
-app.mount('/images', StaticFiles(directory=IMG_DIR), name="images")
+# 按请求的性能分析(X-Profile请求头), 在指标中间件之内执行; PROFILE_SECRET为空时不注册
+if PROFILE_SECRET:
+    app.middleware("http")(profiling.profile_request)
+
+    @app.get('/debug/profiles', include_in_schema=False)
+    async def list_profiles(x_profile: Optional[str] = Header(None)):
+        profiling.check_secret(x_profile)
+        return {'profiles': profiling.list_traces()}
+
+    @app.get('/debug/profiles/{profile_id}', include_in_schema=False)
+    async def get_profile(profile_id: str, x_profile: Optional[str] = Header(None)):
+        profiling.check_secret(x_profile)
+        return profiling.get_trace(profile_id)
+
+# 添加指标中间件, 记录SQL统计
+instrument_engine(async_engine.sync_engine)
+app.middleware("http")(track_request)
+
+# 上传请求体大小限制, 超出时在接收过程中直接返回413
+app.add_middleware(UploadSizeLimit, paths=['/ballkeeper/upload_image/'])
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# 图片: 内容哈希命名的文件长期缓存, 支持304和nginx X-Accel-Redirect
+app.mount('/images', ImageFiles(directory=IMG_DIR), name="images")
@@ -0,0 +1,196 @@
+'''
+运行指标
+
+进程内的Counter/Gauge/Histogram, 以Prometheus文本格式输出(/metrics).
+每个worker进程各自统计, 多worker部署时由Prometheus分别抓取或在网关层汇总
+
+记录的指标:
+    - 按路由的请求耗时分布、状态码计数、正在处理的请求数
+    - 每个请求执行的SQL语句数和SQL耗时(SQLAlchemy引擎事件)
+    - 图片处理(生成默认图片、压缩)耗时, 上传图片压缩的编码次数
+'''
+
+import time
+import threading
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# 默认耗时分桶(秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    inner = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return '{' + inner + '}'
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}']
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶计数..., +Inf计数, 总和]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    def _render_value(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), state[:-1]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', bound)])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        lines.append(f'{self.name}_sum{labels} {state[-1]}')
+        return lines
+
+def render_metrics():
+    """所有指标的Prometheus文本格式"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being processed')
+REQUESTS_TOTAL = Counter('http_requests_total', 'Requests by route and status code', ('method', 'route', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Request latency by route', ('method', 'route'))
+DB_STATEMENT_DURATION = Histogram('db_statement_duration_seconds', 'SQL statement execution time')
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    'db_statements_per_request', 'SQL statements executed per request', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_TIME_PER_REQUEST = Histogram('db_time_per_request_seconds', 'Total SQL time per request', ('route',))
+DB_WRITE_LOCKED = Counter(
+    'db_write_locked_total', 'Write transactions that hit "database is locked", retried or given up', ('event',)
+)
+IMAGE_PROCESSING_DURATION = Histogram(
+    'image_processing_seconds', 'Image task time including queueing in the worker pool', ('task',)
+)
+IMAGE_COMPRESS_ENCODES = Histogram(
+    'image_compress_encodes', 'Encoder runs per uploaded image', ('format',),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15)
+)
+
+class RequestStats:
+    """单个请求的SQL统计"""
+    __slots__ = ('statements', 'db_time', 'trace')
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        # 性能分析时记录每条SQL: [(结束时间, 耗时, 语句)], 未开启时为None
+        self.trace = None
+
+# 当前请求的SQL统计, 由中间件设置, 引擎事件中累加
+current_request_stats = ContextVar('current_request_stats', default=None)
+
+def instrument_engine(engine):
+    """为引擎注册事件, 记录SQL耗时并累加到当前请求"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        DB_STATEMENT_DURATION.observe(elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+            if stats.trace is not None:
+                stats.trace.append((time.perf_counter(), elapsed, statement))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # 执行失败时不会触发after_cursor_execute, 丢弃开始时间
+        starts = exception_context.connection.info.get('query_start') if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+async def track_request(request, call_next):
+    """请求指标中间件"""
+    stats = RequestStats()
+    token = current_request_stats.set(stats)
+    REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS_IN_FLIGHT.dec()
+        current_request_stats.reset(token)
+
+        # 使用路由模板(挂载的子应用使用挂载路径)作为标签, 未匹配的路径统一归为unmatched, 避免标签数量失控
+        route = getattr(request.scope.get('route'), 'path', None) or request.scope.get('root_path') or 'unmatched'
+        REQUESTS_TOTAL.inc(method=request.method, route=route, status=status)
+        REQUEST_DURATION.observe(elapsed, method=request.method, route=route)
+        DB_STATEMENTS_PER_REQUEST.observe(stats.statements, route=route)
+        DB_TIME_PER_REQUEST.observe(stats.db_time, route=route)
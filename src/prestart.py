@@ -0,0 +1,19 @@
+'''
+部署前初始化数据库(建表、迁移、全文索引)
+
+在启动worker之前执行一次, 配合 DB_INIT=skip 使用, worker启动时不再执行任何DDL:
+    python src/prestart.py && DB_INIT=skip uvicorn main:app --workers 4 ...
+'''
+
+import os
+import sys
+import logging
+
+sys.path.append(os.path.dirname(__file__))
+
+from db.database import init_db
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
+    init_db()
+    logging.info("database initialized")
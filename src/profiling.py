@@ -0,0 +1,135 @@
+'''
+按请求的性能分析
+
+请求头 X-Profile 等于 PROFILE_SECRET 时, 对该请求:
+    - 用cProfile记录函数耗时. 只记录事件循环线程, 同时执行的其他请求也会被计入,
+      线程池和图片进程中的耗时不计入; 同一时刻只分析一个请求, 其余请求只记录SQL
+    - 通过SQLAlchemy引擎事件(metrics.instrument_engine)记录每条SQL语句和耗时, 不记录参数
+记录保存在进程内最近 PROFILE_TRACE_SIZE 条中, 响应头返回:
+    - X-Profile-Id: 记录id, 通过 GET /debug/profiles/{id} 获取完整记录(同样需要X-Profile请求头)
+    - Server-Timing: 总耗时、SQL耗时和语句数, 可在浏览器开发者工具中查看
+PROFILE_SECRET为空(默认)时main不注册中间件和查询路由, 不产生任何开销
+'''
+
+import os
+import hmac
+import time
+import pstats
+import cProfile
+import secrets
+import logging
+from collections import OrderedDict
+from fastapi import HTTPException
+from envs import PROFILE_SECRET, PROFILE_TRACE_SIZE, PROFILE_TOP
+from metrics import current_request_stats
+
+logger = logging.getLogger("ballkeeper")
+
+PROFILE_HEADER = "x-profile"
+# 单条SQL语句保留的最大长度
+MAX_STATEMENT_LENGTH = 500
+
+# 最近的分析记录: id -> 记录
+_traces = OrderedDict()
+# 是否有请求正在被cProfile分析(仅在事件循环线程中读写)
+_profiling = False
+
+def is_authorized(secret):
+    # NOTE: 按字节比较, compare_digest比较含非ASCII字符的str时抛出TypeError
+    return (bool(PROFILE_SECRET) and secret is not None
+            and hmac.compare_digest(secret.encode('utf8'), PROFILE_SECRET.encode('utf8')))
+
+def check_secret(secret):
+    """查询分析记录的权限检查"""
+    if not is_authorized(secret):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+def get_trace(profile_id):
+    trace = _traces.get(profile_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Profile does not exist")
+    return trace
+
+def list_traces():
+    """最近的分析记录摘要, 新的在前"""
+    keys = ('id', 'method', 'path', 'status', 'duration_ms', 'db_time_ms', 'statements')
+    return [{key: trace[key] for key in keys} for trace in reversed(_traces.values())]
+
+def summarize(profiler, limit=PROFILE_TOP):
+    """按累计耗时排序的前limit个函数"""
+    rows = sorted(pstats.Stats(profiler).stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': f"{os.path.basename(file)}:{line}({name})",
+            'calls': calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        }
+        for (file, line, name), (_, calls, tottime, cumtime, _) in rows
+    ]
+
+def _save(trace):
+    _traces[trace['id']] = trace
+    if len(_traces) > PROFILE_TRACE_SIZE:
+        _traces.popitem(last=False)
+
+async def profile_request(request, call_next):
+    """性能分析中间件, 需注册在track_request之内(先注册), 以使用其设置的请求SQL统计"""
+    # 查询分析记录的请求同样带有X-Profile请求头, 不分析
+    if not is_authorized(request.headers.get(PROFILE_HEADER)) or request.url.path.startswith('/debug/'):
+        return await call_next(request)
+
+    global _profiling
+    stats = current_request_stats.get()
+    sql_trace = []
+    if stats is not None:
+        stats.trace = sql_trace
+
+    profiler = None
+    if not _profiling:
+        _profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+        if stats is not None:
+            stats.trace = None
+
+        db_time = sum(duration for _, duration, _ in sql_trace)
+        trace = {
+            'id': secrets.token_hex(8),
+            'method': request.method,
+            'path': request.url.path,
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 3),
+            'db_time_ms': round(db_time * 1000, 3),
+            'statements': len(sql_trace),
+            # 每条SQL相对请求开始的时间和耗时
+            'sql': [
+                {
+                    'start_ms': round((end - duration - start) * 1000, 3),
+                    'duration_ms': round(duration * 1000, 3),
+                    'statement': statement[:MAX_STATEMENT_LENGTH],
+                }
+                for end, duration, statement in sql_trace
+            ],
+            'profile': summarize(profiler) if profiler is not None else None,
+        }
+        _save(trace)
+        logger.info(f"profiled {request.method} {request.url.path}: id={trace['id']}, "
+                    f"{trace['duration_ms']}ms, {len(sql_trace)} statement(s) {trace['db_time_ms']}ms")
+
+    response.headers['X-Profile-Id'] = trace['id']
+    response.headers['Server-Timing'] = (
+        f'total;dur={trace["duration_ms"]}, db;dur={trace["db_time_ms"]};desc="{len(sql_trace)} statements"'
+    )
+    return response
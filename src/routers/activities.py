@@ -1,12 +1,19 @@
 import logging
-from envs import ROOT_DIR
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlmodel import Session, select
+from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import select, func
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from img_generator.img_gen import gen_txt_img
-from db.models import User, UserBase, Activity, ActivityUser, Team
+from img_generator.worker import save_txt_img
+from db.models import User, UserBase, Activity, ActivityUser, Team, SignupItem
 from db.database import get_session
-from utils import get_img_path
+from db.pagination import paginate, page_result, MAX_LIMIT
+from db.batch import check_batch_size, fetch_by_ids
+from db.retry import run_write
+from cache import entity_cache
 from constants import SignupType
 from datetime import datetime
 
@@ -15,31 +22,33 @@ logger = logging.getLogger("ballkeeper")
 router = APIRouter()
 
 @router.post('/ballkeeper/create_activity/')
-async def create_activity(activity: Activity, session: Session = Depends(get_session)):
+async def create_activity(activity: Activity, session: AsyncSession = Depends(get_session)):
     try:
         logger.debug(f"Creating activity: {activity}")
         # 检查用户是否存在
-        user_exists = session.exec(select(User).where(User.id == activity.creator_id)).first()
+        user_exists = (await session.exec(select(User).where(User.id == activity.creator_id))).first()
         if not user_exists:
             raise HTTPException(
                 status_code=409,
                 detail="User does not exist"
             )
 
+        # 报名人数由signup_act维护
+        activity.attend_count = activity.pending_count = activity.absent_count = 0
+
         # 生成默认头像
         if not activity.cover_path:
-            img = gen_txt_img(activity.name)
-            img_path = get_img_path("activity", ".png")
-            abs_path = f"{ROOT_DIR}{img_path}"
-            img.save(abs_path)
-            activity.cover_path = img_path
-
-        session.add(activity)
-        session.commit()
-        session.refresh(activity)
+            activity.cover_path = await save_txt_img(activity.name, "activity")
+
+        async def write():
+            session.add(activity)
+            await session.commit()
+            await session.refresh(activity)
+
+        await run_write(session, write)
         return {'activity': activity}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database operation error: {e}")
         raise HTTPException(
             status_code=500,
@@ -47,12 +56,12 @@ async def create_activity(activity: Activity, session: Session = Depends(get_ses
         )
 
 @router.get('/ballkeeper/get_my_activities/')
-async def get_my_activities(user_id: int, session: Session = Depends(get_session)):
+async def get_my_activities(user_id: int, session: AsyncSession = Depends(get_session)):
     try:
-        activities = session.exec(select(Activity).where(Activity.creator_id == user_id)).all()
+        activities = (await session.exec(select(Activity).where(Activity.creator_id == user_id))).all()
         return {'activities': activities}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database operation error: {e}")
         raise HTTPException(
             status_code=500,
@@ -60,68 +69,125 @@ async def get_my_activities(user_id: int, session: Session = Depends(get_session
         )
 
 @router.get('/ballkeeper/get_activities/')
-async def get_activities(session: Session = Depends(get_session)):
+async def get_activities(limit: int = Query(10, ge=1, le=MAX_LIMIT), cursor: Optional[str] = None, session: AsyncSession = Depends(get_session)):
     try:
-        activities = session.exec(select(Activity)).all()
-        return {'activities': activities}
+        query = paginate(select(Activity), (Activity.start_time, Activity.id), cursor, limit)
+        activities = (await session.exec(query)).all()
+        activities, next_cursor = page_result(activities, limit, lambda a: (a.start_time, a.id))
+        return {'activities': activities, 'next_cursor': next_cursor, 'limit': limit}
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(f"Database operation error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Database operation failed"
+        )
+
+@router.get('/ballkeeper/get_activities_by_ids/')
+async def get_activities_by_ids(activity_ids: List[int] = Query(...), session: AsyncSession = Depends(get_session)):
+    try:
+        activities, missing = await fetch_by_ids(session, Activity, activity_ids)
+        return {'activities': activities, 'missing': missing}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database operation error: {e}")
         raise HTTPException(
             status_code=500,
             detail="Database operation failed"
         )
 
+def count_signups(act_id: int, signup_type: int):
+    return (
+        select(func.count())
+        .where(ActivityUser.activity_id == act_id, ActivityUser.signup_type == signup_type)
+        .scalar_subquery()
+    )
+
+async def update_signup_counts(act_id: int, session: AsyncSession):
+    """按报名记录重新统计活动的各类报名人数, 需与报名记录的修改在同一事务中执行"""
+    await session.exec(
+        update(Activity)
+        .where(Activity.id == act_id)
+        .values(
+            attend_count=count_signups(act_id, SignupType.ATTENDING),
+            pending_count=count_signups(act_id, SignupType.PENDING),
+            absent_count=count_signups(act_id, SignupType.ABSENT),
+        )
+    )
+
+async def query_act_users(act_id: int, session: AsyncSession):
+    """一次联表查询活动的报名用户, 并按报名类型分组"""
+    results = (await session.exec(
+        select(ActivityUser.user_id, ActivityUser.signup_type, User)
+        .outerjoin(User, User.id == ActivityUser.user_id)
+        .where(ActivityUser.activity_id == act_id)
+        .order_by(ActivityUser.create_time)
+    )).all()
+
+    users_by_type = {
+        SignupType.ATTENDING: [],
+        SignupType.PENDING: [],
+        SignupType.ABSENT: [],
+    }
+    for user_id, signup_type, user in results:
+        if not user:
+            raise HTTPException(
+                status_code=404,
+                detail=f"User[{user_id}] for Activity[{act_id}] not exists"
+            )
+        if signup_type in users_by_type:
+            users_by_type[signup_type].append(UserBase.model_validate(user))
+    return {
+        'attend_users': users_by_type[SignupType.ATTENDING],
+        'pending_users': users_by_type[SignupType.PENDING],
+        'absent_users': users_by_type[SignupType.ABSENT]
+    }
+
 @router.get('/ballkeeper/get_act_users/')
-async def get_act_users(act_id: int, session: Session = Depends(get_session)):
+async def get_act_users(act_id: int, session: AsyncSession = Depends(get_session)):
     try:
-        act_users = session.exec(
-            select(ActivityUser).where(
-                ActivityUser.activity_id == act_id
-            ).order_by(ActivityUser.create_time)
-        ).all()
-
-        logger.debug(f"DBG: 0 act_users: {act_users}")
-        attend_users = []
-        pending_users = []
-        absent_users = []
-        for act_user in act_users:
-            user_exists = session.exec(select(User).where(User.id == act_user.user_id)).first()
-            if not user_exists:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"User[{act_user.user_id}] for Activity[{act_id}] not exists"
-                )
-            if act_user.signup_type == SignupType.ATTENDING:
-                attend_users.append(UserBase.model_validate(user_exists))
-            elif act_user.signup_type == SignupType.PENDING:
-                pending_users.append(UserBase.model_validate(user_exists))
-            elif act_user.signup_type == SignupType.ABSENT:
-                absent_users.append(UserBase.model_validate(user_exists))
-        return {'attend_users': attend_users, 'pending_users': pending_users, 'absent_users': absent_users}
+        return await query_act_users(act_id, session)
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         error_msg = f'DB error: {str(e)}'
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=f'DB error: {str(e)}')
 
 @router.get('/ballkeeper/get_activity/')
-async def get_activity(activity_id: int, session: Session = Depends(get_session)):
+async def get_activity(activity_id: int, session: AsyncSession = Depends(get_session)):
+    cached = entity_cache.get(('activity', activity_id))
+    if cached is not None:
+        return cached
     try:
-        activity = session.exec(select(Activity).where(Activity.id == activity_id)).first()
+        # 活动、创建者、球队一次联表查询获取
+        result = (await session.exec(
+            select(Activity, User, Team)
+            .outerjoin(User, User.id == Activity.creator_id)
+            .outerjoin(Team, Team.id == Activity.team_id)
+            .where(Activity.id == activity_id)
+        )).first()
+        if not result:
+            raise HTTPException(status_code=404, detail=f"Activity[{activity_id}] not exists")
+        activity, act_creator, act_team = result
+        logger.debug(f"creator for activity[{activity_id}]: {act_creator}, team: {act_team}")
+
         # get activity users info
-        act_users = await get_act_users(activity_id, session)
+        act_users = await query_act_users(activity_id, session)
         logger.debug(f"users for activity[{activity_id}]: {act_users}")
 
-        act_creator = session.exec(select(User).where(User.id == activity.creator_id)).first() if activity.creator_id else None
-        logger.debug(f"creator for activity[{activity_id}]: {act_creator}")
-
-        act_team = session.exec(select(Team).where(Team.id == activity.team_id)).first() if activity.team_id != 0 else None
-        logger.debug(f"team for activity[{activity_id}]: {act_team}")
-
-        return {'activity': activity, **act_users, 'creator': UserBase.model_validate(act_creator), 'team': act_team}
+        result = jsonable_encoder({
+            'activity': activity,
+            **act_users,
+            'creator': UserBase.model_validate(act_creator) if act_creator else None,
+            'team': act_team
+        })
+        # 创建者、球队和报名用户的数据嵌入在结果中, 这些用户、球队的缓存失效时活动的缓存一并失效
+        dependencies = {('user', activity.creator_id), ('team', activity.team_id)}
+        dependencies.update(('user', user.id) for users in act_users.values() for user in users)
+        entity_cache.set(('activity', activity_id), result, depends_on=dependencies)
+        return result
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         error_msg = f'DB error: {str(e)}'
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
@@ -131,35 +197,130 @@ async def signup_act(
     act_id: int = Body(...),
     user_id: int = Body(...),
     signup_type: int = Body(...),
-    session: Session = Depends(get_session)):
-    try:
-        activity = session.exec(select(Activity).where(Activity.id == act_id)).first()
+    session: AsyncSession = Depends(get_session)):
+    # 写锁冲突时重试整个事务
+    async def write():
+        # NOTE: 事务中先写入报名记录以获取SQLite写锁, 之后读取的人数不会被并发报名修改,
+        # 超出人数上限时回滚, 并发报名不会超额
+        await session.exec(upsert_signup(), params={
+            'activity_id': act_id,
+            'user_id': user_id,
+            'signup_type': signup_type,
+            'create_time': int(datetime.now().timestamp())  # 仅在新建时生效
+        })
+        logger.debug(f"更新或创建用户报名: user_id={user_id}, activity_id={act_id}, signup_type={signup_type}")
+        await update_signup_counts(act_id, session)
+
+        activity = (await session.exec(select(Activity).where(Activity.id == act_id))).first()
         if not activity:
+            await session.rollback()
             raise HTTPException(status_code=404, detail=f"Activity[{act_id}] not exists")
 
         # check user_id is valid
-        user = session.exec(select(User).where(User.id == user_id)).first()
+        user = (await session.exec(select(User).where(User.id == user_id))).first()
         if not user:
+            await session.rollback()
             raise HTTPException(status_code=404, detail=f"User[{user_id}] not exists")
 
-        # 创建ActivityUser对象
-        activity_user = ActivityUser(
-            activity_id=act_id,
-            user_id=user_id,
-            signup_type=signup_type,
-            create_time=int(datetime.now().timestamp())  # 仅在新建时生效
-        )
+        # max_attend为0表示不限人数
+        if signup_type == SignupType.ATTENDING and 0 < activity.max_attend < activity.attend_count:
+            await session.rollback()
+            raise HTTPException(status_code=409, detail=f"Activity[{act_id}] is full")
 
-        # merge操作会自动检查是否存在记录，存在则更新，不存在则插入
-        activity_user = session.merge(activity_user)
-        logger.debug(f"更新或创建用户报名: user_id={user_id}, activity_id={act_id}, signup_type={signup_type}")
+        await session.commit()
+        return activity, user
 
-        session.commit()
-        session.refresh(activity_user)
-        session.refresh(user)
-        return {'activity_user': activity_user, 'user': user}
+    try:
+        activity, user = await run_write(session, write)
+        # 活动详情中包含报名名单和人数
+        entity_cache.invalidate(('activity', act_id))
+        activity_user = (await session.exec(
+            select(ActivityUser).where(ActivityUser.activity_id == act_id, ActivityUser.user_id == user_id)
+        )).first()
+        return {'activity_user': activity_user, 'user': user, 'activity': activity}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         error_msg = f'DB error: {str(e)}'
         logger.error(error_msg)
-        raise HTTPException(status_code=500, detail=error_msg)
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def upsert_signup():
+    """新建或更新报名记录, 已存在时只更新报名类型"""
+    statement = sqlite_insert(ActivityUser)
+    return statement.on_conflict_do_update(
+        index_elements=['activity_id', 'user_id'],
+        set_={'signup_type': statement.excluded.signup_type}
+    )
+
+@router.post('/ballkeeper/signup_act_batch/')
+async def signup_act_batch(
+    act_id: int = Body(...),
+    signups: List[SignupItem] = Body(...),
+    session: AsyncSession = Depends(get_session)):
+    """
+    批量报名
+
+    一次IN查询校验用户和已有报名, 一次executemany写入, 返回每一项的结果(status为200/404/409).
+    同一用户出现多次时以最后一项为准
+    """
+    check_batch_size(signups)
+    items = list({item.user_id: item for item in signups}.values())
+    user_ids = [item.user_id for item in items]
+
+    # 写锁冲突时重试整个事务
+    async def write():
+        # NOTE: 与signup_act相同, 先执行写操作获取SQLite写锁, 之后读取的人数不会被并发报名修改
+        await update_signup_counts(act_id, session)
+        activity = (await session.exec(select(Activity).where(Activity.id == act_id))).first()
+        if not activity:
+            await session.rollback()
+            raise HTTPException(status_code=404, detail=f"Activity[{act_id}] not exists")
+
+        existing_users = set((await session.exec(select(User.id).where(User.id.in_(user_ids)))).all())
+        current_types = dict((await session.exec(
+            select(ActivityUser.user_id, ActivityUser.signup_type)
+            .where(ActivityUser.activity_id == act_id, ActivityUser.user_id.in_(user_ids))
+        )).all())
+
+        # 按请求顺序依次占用名额
+        attend_count = activity.attend_count
+        create_time = int(datetime.now().timestamp())
+        results, rows = [], []
+        for item in items:
+            if item.user_id not in existing_users:
+                results.append({'user_id': item.user_id, 'status': 404, 'detail': f"User[{item.user_id}] not exists"})
+                continue
+            was_attending = current_types.get(item.user_id) == SignupType.ATTENDING
+            attending = item.signup_type == SignupType.ATTENDING
+            if attending and not was_attending:
+                if 0 < activity.max_attend <= attend_count:
+                    results.append({'user_id': item.user_id, 'status': 409, 'detail': f"Activity[{act_id}] is full"})
+                    continue
+                attend_count += 1
+            elif was_attending and not attending:
+                attend_count -= 1
+            rows.append({
+                'activity_id': act_id,
+                'user_id': item.user_id,
+                'signup_type': item.signup_type,
+                'create_time': create_time  # 仅在新建时生效
+            })
+            results.append({'user_id': item.user_id, 'status': 200, 'signup_type': item.signup_type})
+
+        if rows:
+            await session.exec(upsert_signup(), params=rows)
+            await update_signup_counts(act_id, session)
+        await session.commit()
+        return activity, results, rows
+
+    try:
+        activity, results, rows = await run_write(session, write)
+        entity_cache.invalidate(('activity', act_id))
+        await session.refresh(activity)
+        logger.debug(f"批量报名: activity_id={act_id}, 成功{len(rows)}/{len(items)}")
+        return {'results': results, 'activity': activity}
+    except SQLAlchemyError as e:
+        await session.rollback()
+        error_msg = f'DB error: {str(e)}'
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
@@ -1,13 +1,18 @@
 import logging
-from envs import ROOT_DIR
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from img_generator.img_gen import gen_txt_img
-from db.models import User, League, UserLeague
+from img_generator.worker import save_txt_img
+from db.models import League, UserLeague
 from db.database import get_session
-from utils import get_img_path
+from db.pagination import paginate, page_result, MAX_LIMIT
+from db.retry import run_write
+from cache import entity_cache
+from utils import pick_variant
+from auth import CurrentUser, current_user
 
 
 logger = logging.getLogger("ballkeeper")
@@ -16,22 +21,15 @@ router = APIRouter()
 
 @router.post('/ballkeeper/create_league/')
 async def create_league(
-    creator: str = Body(...),
     name: str = Body(...),
     league_type_ind: int = Body(...),
     mobile: str = Body(...),
     content: Optional[str] = Body(None),
     cover_path: Optional[str] = Body(None),
-    session: Session = Depends(get_session)
+    user: CurrentUser = Depends(current_user('creator', body=True)),
+    session: AsyncSession = Depends(get_session)
 ):
     try:
-        user = session.exec(select(User).where(User.username == creator)).first()
-        if not user:
-            raise HTTPException(
-                status_code=401,
-                detail="User does not exist"
-            )
-
         # 创建新联赛
         league = League(
             name=name,
@@ -43,29 +41,28 @@ async def create_league(
         )
 
         if not league.cover_path:
-            img = gen_txt_img(name, (100, 100))
-            img_path = get_img_path("league", ".png")
-            abs_path = f"{ROOT_DIR}{img_path}"
-            img.save(abs_path)
-            league.cover_path = img_path
+            league.cover_path = await save_txt_img(name, "league", (100, 100))
 
-        session.add(league)
-        session.commit()
-        session.refresh(league)
+        # 联赛和创建者关联记录在同一个事务中写入, 写锁冲突时重试整个事务
+        async def write():
+            session.add(league)
+            await session.flush()
 
-        # 创建用户-联赛关联记录,设置创建者角色
-        user_league = UserLeague(
-            user_id=user.id,
-            league_id=league.id,
-            role="creator"  # 设置为创建者角色
-        )
-        session.add(user_league)
-        session.commit()
+            # 创建用户-联赛关联记录,设置创建者角色
+            user_league = UserLeague(
+                user_id=user.id,
+                league_id=league.id,
+                role="creator"  # 设置为创建者角色
+            )
+            session.add(user_league)
+            await session.commit()
+
+        await run_write(session, write)
         logger.info(f"League created successfully: {league}")
 
         return {'league': league}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         # 检查是否是唯一约束违反错误
         logger.error(f"Caught SQLAlchemyError: {e}")
         if "UNIQUE constraint failed" in str(e):
@@ -77,42 +74,52 @@ async def create_league(
         raise HTTPException(status_code=500, detail="Failed to create league")
 
 @router.get('/ballkeeper/get_league/')
-async def get_league(league_id: int, session: Session = Depends(get_session)):
+async def get_league(league_id: int, session: AsyncSession = Depends(get_session)):
+    cached = entity_cache.get(('league', league_id))
+    if cached is not None:
+        return cached
     try:
         logger.debug(f"Fetching league")
-        league = session.exec(select(League).where(League.id == league_id)).first()
+        league = (await session.exec(select(League).where(League.id == league_id))).first()
         if not league:
             raise HTTPException(
                 status_code=401,
                 detail="League does not exist"
             )
 
-        return {'league': league}
+        result = jsonable_encoder({'league': league})
+        entity_cache.set(('league', league_id), result)
+        return result
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to get league: {e}")
         raise HTTPException(status_code=500, detail="Failed to get league")
 
+def with_cover_variant(leagues, img_size):
+    """按img_size返回合适尺寸的联赛封面"""
+    if not img_size:
+        return leagues
+    return [{**dict(league), 'cover_path': pick_variant(league.cover_path, img_size)} for league in leagues]
+
 @router.get('/ballkeeper/get_leagues/')
-async def get_leagues(limit : int = 10, offset : int = 0, session: Session = Depends(get_session)):
+async def get_leagues(limit : int = Query(10, ge=1, le=MAX_LIMIT), cursor : Optional[str] = None, img_size : Optional[int] = None, session: AsyncSession = Depends(get_session)):
     try:
-        leagues = session.exec(select(League).offset(offset).limit(limit)).all()
-        return {'leagues': leagues, 'offset': offset, 'limit': limit}
+        leagues = (await session.exec(paginate(select(League), (League.id,), cursor, limit))).all()
+        leagues, next_cursor = page_result(leagues, limit, lambda league: (league.id,))
+        return {'leagues': with_cover_variant(leagues, img_size), 'next_cursor': next_cursor, 'limit': limit}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to get league list: {e}")
         raise HTTPException(status_code=500, detail="Failed to get league list")
 
 @router.get('/ballkeeper/get_my_leagues/')
-async def get_my_leagues(username : str, limit : int = 10, offset : int = 0, session: Session = Depends(get_session)):
+async def get_my_leagues(limit : int = Query(10, ge=1, le=MAX_LIMIT), cursor : Optional[str] = None, img_size : Optional[int] = None, user: CurrentUser = Depends(current_user()), session: AsyncSession = Depends(get_session)):
     try:
-        user = session.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User does not exist")
-
-        leagues = session.exec(select(League).where(League.creator_id == user.id).offset(offset).limit(limit)).all()
-        return {'leagues': leagues, 'offset': offset, 'limit': limit}
+        query = paginate(select(League).where(League.creator_id == user.id), (League.id,), cursor, limit)
+        leagues = (await session.exec(query)).all()
+        leagues, next_cursor = page_result(leagues, limit, lambda league: (league.id,))
+        return {'leagues': with_cover_variant(leagues, img_size), 'next_cursor': next_cursor, 'limit': limit}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to get league list: {e}")
         raise HTTPException(status_code=500, detail="Failed to get league list")
@@ -1,16 +1,21 @@
 import os
+import re
 import logging
-from envs import ROOT_DIR
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from db.database import get_session
-from utils import compress_image, get_img_path
+from utils import image_variants
+from img_generator.worker import compress_image_file
+from upload import save_upload
 
 
 logger = logging.getLogger("ballkeeper")
 
 router = APIRouter()
 
+# image_type用作图片文件名前缀
+IMAGE_TYPE = re.compile(r'^[a-z0-9_-]{1,32}$')
+
 @router.get('/ballkeeper/')
 async def hello_world():
     return {'Hello': 'World'}
@@ -20,36 +25,36 @@ async def get_app_info():
     return {'name': 'ballkeeper', 'logo_path': '/images/app/logo.png', 'version': '1.0.0'}
 
 @router.post('/ballkeeper/upload_image/')
-async def upload_image(image_type: str=Form(...), image: UploadFile = File(...), session: Session = Depends(get_session)):
+async def upload_image(image_type: str=Form(...), image: UploadFile = File(...), session: AsyncSession = Depends(get_session)):
     logger.info(f"DEBUG: image_type: {image_type}")
+    if not IMAGE_TYPE.match(image_type):
+        raise HTTPException(status_code=400, detail="Invalid image_type")
+    tmp_path = None
     try:
-        # 读取上传文件内容
-        contents = await image.read()
+        # 分块写入临时文件, 超出大小上限时返回413
+        tmp_path = await save_upload(image)
 
         # 获取文件扩展名
         ext = os.path.splitext(image.filename)[1].lower()
 
-        # 生成文件名和路径
-        img_path = get_img_path(image_type, ext)
-        abs_path = f"{ROOT_DIR}{img_path}"
-
-        # 压缩图片
-        compressed_img = compress_image(contents, ext)
-
-        # 保存压缩后的图片
-        logger.info(f"DEBUG: save compressed image to {abs_path}")
-        with open(abs_path, "wb") as f:
-            f.write(compressed_img)
-
-        # 构造返回URL
+        # 在图片进程中从临时文件解码、压缩, 以内容哈希命名并原子写入, 同时生成尺寸变体
+        _, img_path = await compress_image_file(tmp_path, image_type, ext)
+        logger.info(f"DEBUG: saved compressed image to {img_path}")
 
         return {
-            'img_path': img_path
+            'img_path': img_path,
+            # 变体尺寸 -> URL, 只有比原图小的尺寸
+            'variants': image_variants(img_path)
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to upload image: {e}")
         raise HTTPException(
             status_code=500,
             detail="Failed to upload image"
         )
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
@@ -0,0 +1,56 @@
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+from db.database import get_session
+from db.search import ENTITY_TYPES, search_rowids, parse_rowid
+from db.pagination import MAX_LIMIT
+
+logger = logging.getLogger("ballkeeper")
+
+router = APIRouter()
+
+@router.get('/ballkeeper/search/')
+async def search(
+    keyword: str,
+    entity_type: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_session)
+):
+    '''
+    按名称和简介搜索球队、联赛、活动, 结果按相关度排序
+
+    entity_type为空时搜索全部类型, 否则为 team/league/activity 之一
+    '''
+    if entity_type and entity_type not in ENTITY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown entity_type: {entity_type}")
+
+    query = search_rowids(keyword, entity_type)
+    if query is None:
+        return {'results': [], 'offset': offset, 'limit': limit}
+
+    try:
+        rowids = (await session.exec(query.offset(offset).limit(limit))).scalars().all()
+
+        # 按类型分组, 每种类型一次IN查询取回实体
+        hits = [parse_rowid(rowid) for rowid in rowids]
+        entities = {}
+        for name, (_, model) in ENTITY_TYPES.items():
+            ids = [entity_id for hit_type, entity_id in hits if hit_type == name]
+            if ids:
+                rows = (await session.exec(select(model).where(model.id.in_(ids)))).all()
+                entities.update({(name, row.id): row for row in rows})
+
+        results = [
+            {'entity_type': hit_type, 'id': entity_id, 'data': entities[(hit_type, entity_id)]}
+            for hit_type, entity_id in hits
+            if (hit_type, entity_id) in entities
+        ]
+        return {'results': results, 'offset': offset, 'limit': limit}
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(f"Failed to search: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search")
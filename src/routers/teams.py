@@ -1,73 +1,37 @@
-import os
 import logging
-from envs import ROOT_DIR
-from typing import Optional
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Body
-from sqlmodel import Session, select
+from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from img_generator.img_gen import gen_txt_img
+from img_generator.worker import save_txt_img
 from db.models import User, Team, UserTeam, League, UserLeague
 from db.database import get_session
-from utils import compress_image, get_img_path
+from db.batch import fetch_by_ids
+from db.retry import run_write
+from db.pagination import paginate, page_result, MAX_LIMIT
+from db.search import match_ids
+from cache import entity_cache
+from utils import pick_variant
+from auth import CurrentUser, current_user
 
 
 logger = logging.getLogger("ballkeeper")
 
 router = APIRouter()
 
-@router.post('/ballkeeper/upload_image/')
-async def upload_image(image_type: str=Form(...), image: UploadFile = File(...), session: Session = Depends(get_session)):
-    logger.info(f"DEBUG: image_type: {image_type}")
-    try:
-        # 读取上传文件内容
-        contents = await image.read()
-
-        # 获取文件扩展名
-        ext = os.path.splitext(image.filename)[1].lower()
-
-        # 生成文件名和路径
-        img_path = get_img_path(image_type, ext)
-        abs_path = f"{ROOT_DIR}{img_path}"
-
-        # 压缩图片
-        compressed_img = compress_image(contents, ext)
-
-        # 保存压缩后的图片
-        logger.info(f"DEBUG: save compressed image to {abs_path}")
-        with open(abs_path, "wb") as f:
-            f.write(compressed_img)
-
-        # 构造返回URL
-
-        return {
-            'img_path': img_path
-        }
-    except Exception as e:
-        session.rollback()
-        logger.error(f"Failed to upload image: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to upload image"
-        )
-
 @router.post('/ballkeeper/create_team/')
 async def create_team(
-    username: str = Body(...),
     name: str = Body(...),
     team_type: int = Body(...),
     is_public: bool = Body(...),
     mobile: str = Body(...),
     content: Optional[str] = Body(None),
-    session: Session = Depends(get_session)
+    user: CurrentUser = Depends(current_user(body=True)),
+    session: AsyncSession = Depends(get_session)
 ):
     try:
-        user = session.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise HTTPException(
-                status_code=401,
-                detail="User does not exist"
-            )
-
         # 创建新团队
         team = Team(
             name=name,
@@ -79,33 +43,31 @@ async def create_team(
         )
 
         if not team.logo_path:
-            img = gen_txt_img(name)
-            img_path = get_img_path("team", ".png")
-            abs_path = f"{ROOT_DIR}{img_path}"
-            img.save(abs_path)
-            team.logo_path = img_path
+            team.logo_path = await save_txt_img(name, "team")
 
-        session.add(team)
-        session.commit()
-        session.refresh(team)
+        # 球队、用户所属球队和创建者关联记录在同一个事务中写入, 写锁冲突时重试整个事务
+        async def write():
+            session.add(team)
+            await session.flush()
 
-        user.team_id = team.id
-        session.add(user)
-        session.commit()
+            await session.exec(update(User).where(User.id == user.id).values(team_id=team.id))
 
-        # 创建用户-球队关联记录,设置创建者角色
-        user_team = UserTeam(
-            user_id=user.id,
-            team_id=team.id,
-            role="creator"  # 设置为创建者角色
-        )
-        session.add(user_team)
-        session.commit()
+            # 创建用户-球队关联记录,设置创建者角色
+            user_team = UserTeam(
+                user_id=user.id,
+                team_id=team.id,
+                role="creator"  # 设置为创建者角色
+            )
+            session.add(user_team)
+            await session.commit()
+
+        await run_write(session, write)
+        entity_cache.invalidate(('user', user.id))
         logger.info(f"Team created successfully: {team}")
 
         return {'team': team}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         # 检查是否是唯一约束违反错误
         logger.error(f"Caught SQLAlchemyError: {e}")
         if "UNIQUE constraint failed" in str(e):
@@ -117,7 +79,10 @@ async def create_team(
         raise HTTPException(status_code=500, detail="Failed to create team")
 
 @router.get('/ballkeeper/get_team/')
-async def get_team(team_id: int, session: Session = Depends(get_session)):
+async def get_team(team_id: int, session: AsyncSession = Depends(get_session)):
+    cached = entity_cache.get(('team', team_id))
+    if cached is not None:
+        return cached
     try:
         # 构建基础查询
         query = (
@@ -126,65 +91,75 @@ async def get_team(team_id: int, session: Session = Depends(get_session)):
         )
 
         # 执行查询
-        team = session.exec(query).first()
+        team = (await session.exec(query)).first()
         if not team:
             raise HTTPException(status_code=404, detail="Team does not exist")
 
-        return {'team': team}
+        result = jsonable_encoder({'team': team})
+        entity_cache.set(('team', team_id), result)
+        return result
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to get team(id={team_id}): {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get team(id={team_id})")
 
+@router.get('/ballkeeper/get_teams_by_ids/')
+async def get_teams_by_ids(team_ids: List[int] = Query(...), session: AsyncSession = Depends(get_session)):
+    try:
+        teams, missing = await fetch_by_ids(session, Team, team_ids)
+        return {'teams': teams, 'missing': missing}
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(f"Failed to get teams(ids={team_ids}): {e}")
+        raise HTTPException(status_code=500, detail="Failed to get teams")
+
 '''
 单个参数时, 需要 embed=True 来强制使用 JSON 对象格式
 多个参数时, FastAPI 自动使用 JSON 对象格式，不需要 embed=True
 '''
 @router.get('/ballkeeper/get_team_list/')
 async def get_team_list(
-    username: str,
     keyword: str,
-    limit: int,
-    offset: int,
-    session: Session = Depends(get_session)
+    limit: int = Query(..., ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    img_size: Optional[int] = None,
+    user: CurrentUser = Depends(current_user()),
+    session: AsyncSession = Depends(get_session)
 ):
     try:
-        user = session.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise HTTPException(
-                status_code=401,
-                detail="User does not exist"
-            )
-
         # 构建基础查询
         query = (
-            select(Team, UserTeam.follow_time, UserTeam.role)
+            select(Team, UserTeam.follow_time, UserTeam.role, UserTeam.id)
             .join(UserTeam)
             .where(UserTeam.user_id == user.id)
         )
 
-        # 添加标题搜索条件（如果keyword不为空）
-        if keyword.strip():
-            query = query.where(Team.name.contains(keyword))
+        # 添加标题搜索条件（如果keyword不为空）, 走全文索引而不是LIKE全表扫描
+        matched_ids = match_ids("team", keyword, "name")
+        if matched_ids is not None:
+            query = query.where(Team.id.in_(matched_ids))
 
-        # 直接添加分页并执行查询 - 完全移除计数部分
-        results = session.exec(query.offset(offset).limit(limit)).all()
+        # 按关注时间游标分页 - 完全移除计数部分
+        query = paginate(query, (UserTeam.follow_time, UserTeam.id), cursor, limit)
+        results = (await session.exec(query)).all()
+        results, next_cursor = page_result(results, limit, lambda row: (row[1], row[3]))
 
-        # 构造返回数据
+        # 构造返回数据, 按img_size返回合适尺寸的球队logo
         team_list = [
             {
                 **dict(team),
+                "logo_path": pick_variant(team.logo_path, img_size),
                 "follow_time": follow_time.isoformat(),
                 "role": role
             }
-            for team, follow_time, role in results
+            for team, follow_time, role, _ in results
         ]
 
         # 简化的响应，不包含总数
-        return {'team_list': team_list, 'offset': offset, 'limit': limit}
+        return {'team_list': team_list, 'next_cursor': next_cursor, 'limit': limit}
 
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to get team list: {e}")
         raise HTTPException(
             status_code=500,
@@ -193,26 +168,23 @@ async def get_team_list(
 
 @router.post('/ballkeeper/follow_team/')
 async def follow_team(
-    username: str = Body(...),
     team_id: int = Body(...),
-    session: Session = Depends(get_session)
+    user: CurrentUser = Depends(current_user(body=True)),
+    session: AsyncSession = Depends(get_session)
 ):
-    try:
-        user = session.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User does not exist")
-
-        team = session.exec(select(Team).where(Team.id == team_id)).first()
+    # 写锁冲突时重试整个事务, 回滚会使已加载的对象过期, 重试时重新查询
+    async def write():
+        team = (await session.exec(select(Team).where(Team.id == team_id))).first()
         if not team:
             raise HTTPException(status_code=404, detail="Team does not exist")
 
         # 检查是否已经加入
-        existing = session.exec(
+        existing = (await session.exec(
             select(UserTeam).where(
                 UserTeam.user_id == user.id,
                 UserTeam.team_id == team_id
             )
-        ).first()
+        )).first()
 
         if existing:
             raise HTTPException(status_code=400, detail="Already joined this team")
@@ -224,13 +196,14 @@ async def follow_team(
             role="member"
         )
         session.add(user_team)
-        session.commit()
-
+        await session.commit()
         return team
 
+    try:
+        return await run_write(session, write)
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Failed to join team: {e}")
         raise HTTPException(status_code=500, detail="Failed to join team")
@@ -1,22 +1,29 @@
+import hmac
 import logging
-from envs import ROOT_DIR
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from img_generator.img_gen import gen_txt_img
+from img_generator.worker import save_txt_img
 from db.models import User, UserBase
 from db.database import get_session
-from utils import get_img_path
+from db.batch import fetch_by_ids
+from db.retry import run_write
+from cache import entity_cache
+from auth import create_token
+from envs import TOKEN_TTL, AUTH_ALLOW_USERNAME
 
 logger = logging.getLogger("ballkeeper")
 
 router = APIRouter()
 
 @router.post('/ballkeeper/register/')
-async def register(user: User, session: Session = Depends(get_session)):
+async def register(user: User, session: AsyncSession = Depends(get_session)):
     try:
         # 检查用户是否存在
-        user_exists = session.exec(select(User).where(User.username == user.username)).first()
+        user_exists = (await session.exec(select(User).where(User.username == user.username))).first()
         if user_exists:
             raise HTTPException(
                 status_code=409,
@@ -25,65 +32,96 @@ async def register(user: User, session: Session = Depends(get_session)):
 
         # 生成默认头像
         if not user.avatar_path:
-            img = gen_txt_img(user.username)
-            img_path = get_img_path("avatar", ".png")
-            abs_path = f"{ROOT_DIR}{img_path}"
-            img.save(abs_path)
-            user.avatar_path = img_path
+            user.avatar_path = await save_txt_img(user.username, "avatar")
 
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+        async def write():
+            session.add(user)
+            await session.commit()
+            await session.refresh(user)
+
+        await run_write(session, write)
         return {'user': UserBase.model_validate(user)}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database operation error: {e}")
         raise HTTPException(
             status_code=500,
             detail="Database operation failed"
         )
 
-@router.get('/ballkeeper/login/')
-async def login(username: str, password: str, session: Session = Depends(get_session)):
+async def check_login(username: str, password: str, session: AsyncSession):
+    """校验用户名和密码, 返回用户信息和令牌"""
     try:
         logger.debug(f"Login user: {username}")
-        user = session.exec(select(User).where(User.username == username)).first()
+        user = (await session.exec(select(User).where(User.username == username))).first()
         if not user:
             raise HTTPException(
                 status_code=404,
                 detail="User does not exist"
             )
 
-        if user.password != password:
+        if not hmac.compare_digest(user.password.encode('utf8'), password.encode('utf8')):
             raise HTTPException(
                 status_code=401,
                 detail="Incorrect password"
             )
 
-        return {'user': UserBase.model_validate(user)}
+        # 后续请求携带令牌(Authorization: Bearer <token>), 不再需要校验密码和查询用户
+        return {'user': UserBase.model_validate(user), 'token': create_token(user), 'expires_in': TOKEN_TTL}
+    except HTTPException:
+        raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database operation error: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Login failed: {e}"
         )
 
+@router.post('/ballkeeper/login/')
+async def login(username: str = Body(...), password: str = Body(...), session: AsyncSession = Depends(get_session)):
+    return await check_login(username, password, session)
+
+async def login_legacy(username: str, password: str, session: AsyncSession = Depends(get_session)):
+    return await check_login(username, password, session)
+
+# 旧版客户端的GET登录(密码在查询参数中), 只在兼容模式下注册
+if AUTH_ALLOW_USERNAME:
+    router.get('/ballkeeper/login/')(login_legacy)
+
 @router.get('/ballkeeper/get_user/')
-async def get_user(user_id: int, session: Session = Depends(get_session)):
+async def get_user(user_id: int, session: AsyncSession = Depends(get_session)):
+    cached = entity_cache.get(('user', user_id))
+    if cached is not None:
+        return cached
     try:
         logger.debug(f"get user by id: {user_id}")
-        user = session.exec(select(User).where(User.id == user_id)).first()
+        user = (await session.exec(select(User).where(User.id == user_id))).first()
         if not user:
             raise HTTPException(
                 status_code=404,
                 detail="User does not exist"
             )
-        return {'user': UserBase.model_validate(user)}
+        result = jsonable_encoder({'user': UserBase.model_validate(user)})
+        entity_cache.set(('user', user_id), result)
+        return result
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database operation error: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"get_user failed: {e}"
         )
+
+@router.get('/ballkeeper/get_users_by_ids/')
+async def get_users_by_ids(user_ids: List[int] = Query(...), session: AsyncSession = Depends(get_session)):
+    try:
+        users, missing = await fetch_by_ids(session, User, user_ids)
+        return {'users': [UserBase.model_validate(user) for user in users], 'missing': missing}
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(f"Database operation error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Database operation failed"
+        )
@@ -0,0 +1,45 @@
+'''
+图片静态文件
+
+内容哈希命名的图片(见 utils.is_hashed_name)内容永不改变:
+    - Cache-Control: public, max-age=IMG_CACHE_MAX_AGE, immutable, 缓存期内客户端不再请求
+    - ETag为文件名中的内容哈希(强校验), If-None-Match/If-Modified-Since命中时返回304
+早期按时间戳命名的图片使用 no-cache, 每次向服务端校验(ETag/Last-Modified).
+
+文件发送:
+    - 配置 IMG_ACCEL_REDIRECT 时只返回 X-Accel-Redirect 响应头, 由nginx用sendfile发送文件
+    - 否则使用FileResponse, ASGI服务器支持 http.response.pathsend 扩展时由服务器直接发送文件
+'''
+
+import os
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from envs import IMG_CACHE_MAX_AGE, IMG_ACCEL_REDIRECT
+from utils import is_hashed_name
+
+# 随文件一起返回、304时保留的响应头
+CACHE_HEADERS = ('etag', 'last-modified', 'cache-control')
+
+class ImageFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        name = os.path.basename(full_path)
+        if is_hashed_name(name):
+            response.headers['etag'] = f'"{os.path.splitext(name)[0]}"'
+            response.headers['cache-control'] = f'public, max-age={IMG_CACHE_MAX_AGE}, immutable'
+        else:
+            response.headers['cache-control'] = 'no-cache'
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        if IMG_ACCEL_REDIRECT:
+            relative_path = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+            headers = {key: response.headers[key] for key in CACHE_HEADERS}
+            headers['x-accel-redirect'] = f"{IMG_ACCEL_REDIRECT.rstrip('/')}/{relative_path}"
+            return Response(status_code=status_code, headers=headers, media_type=response.media_type)
+        return response
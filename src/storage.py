@@ -0,0 +1,129 @@
+'''
+图片存储
+
+图片按key(相对路径, 如 ab/cd/avatar_abcd....png)保存, 数据库中保存 storage.url(key) 返回的URL:
+    - LocalStorage: 保存在 IMG_DIR 下, 由 /images 静态路由提供访问
+    - S3Storage: 保存在S3兼容的对象存储(AWS S3、MinIO等)中, URL为 S3_PUBLIC_URL 下的地址, 需要安装boto3
+
+新图片的文件名包含内容哈希(见 utils.get_img_key), 按哈希前4位分为两级子目录, 避免单个目录文件过多.
+写入是原子的: 本地先写临时文件再替换, S3单次PUT本身即原子.
+图片进程(spawn)导入本模块时按相同配置创建各自的存储对象
+'''
+
+import os
+import mimetypes
+import threading
+from envs import (
+    IMG_DIR, IMG_STORAGE, IMG_CACHE_MAX_AGE,
+    S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX, S3_PUBLIC_URL
+)
+from utils import is_hashed_name
+
+IMG_URL_PREFIX = '/images'
+
+def cache_control(key):
+    """内容哈希命名的图片长期缓存"""
+    if is_hashed_name(os.path.basename(key)):
+        return f'public, max-age={IMG_CACHE_MAX_AGE}, immutable'
+    return 'no-cache'
+
+class LocalStorage:
+    """
+    本地文件存储
+
+    Args:
+        root_dir: 存储目录
+        url_prefix: 图片URL前缀(静态路由的挂载路径)
+    """
+
+    def __init__(self, root_dir: str, url_prefix: str = IMG_URL_PREFIX):
+        self.root_dir = os.path.abspath(root_dir)
+        self.url_prefix = url_prefix
+
+    def path(self, key: str) -> str:
+        """key对应的本地文件路径, key不能指向存储目录之外"""
+        path = os.path.normpath(os.path.join(self.root_dir, key))
+        if not path.startswith(self.root_dir + os.sep):
+            raise ValueError(f"invalid image key: {key}")
+        return path
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def save(self, key: str, data: bytes):
+        """原子写入: 先写临时文件再替换, 读取方不会看到写了一半的文件"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str):
+        """删除key, 不存在时忽略. 分片目录可能正被其他进程写入, 不删除"""
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+class S3Storage:
+    """
+    S3兼容的对象存储
+
+    Args:
+        bucket: 存储桶
+        public_url: 图片的公开访问地址(存储桶或CDN地址)
+        prefix: 对象key前缀
+        endpoint_url: S3服务地址, 使用MinIO等S3兼容服务时设置
+        client: S3客户端, 为空时用boto3创建
+    """
+
+    def __init__(self, bucket: str, public_url: str, prefix: str = '', endpoint_url: str = None, client=None):
+        if client is None:
+            # NOTE: boto3为可选依赖, 只在使用S3存储时导入
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+        self.prefix = prefix
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{self.prefix}{key}"
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def save(self, key: str, data: bytes):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{key}",
+            Body=data,
+            ContentType=mimetypes.guess_type(key)[0] or 'application/octet-stream',
+            CacheControl=cache_control(key),
+        )
+
+    def delete(self, key: str):
+        """删除key, 不存在时S3同样返回成功"""
+        self.client.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+
+def create_storage():
+    if IMG_STORAGE == 's3':
+        return S3Storage(S3_BUCKET, S3_PUBLIC_URL, S3_PREFIX, S3_ENDPOINT_URL)
+    return LocalStorage(IMG_DIR)
+
+storage = create_storage()
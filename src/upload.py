@@ -0,0 +1,109 @@
+'''
+图片上传
+
+上传文件分块写入临时文件, 读取过程中检查大小上限, 每个上传占用的内存与文件大小无关:
+    - UploadSizeLimit: ASGI中间件, 接收上传请求体时累计字节数, 超出上限立即返回413, 不再继续接收
+    - save_upload: 将解析后的上传文件分块复制到临时文件, 供图片进程从文件解码
+'''
+
+import os
+import tempfile
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from envs import UPLOAD_MAX_SIZE, UPLOAD_CHUNK_SIZE
+
+# multipart请求体中除文件内容外的表单字段、边界等开销
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadSizeLimit:
+    """
+    上传请求体大小限制中间件
+
+    Args:
+        app: ASGI应用
+        paths: 需要限制的路由路径
+        max_size: 请求体大小上限(字节)
+    """
+
+    def __init__(self, app, paths, max_size=UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD):
+        self.app = app
+        self.paths = set(paths)
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # 声明的长度已超限时不读取请求体
+        headers = dict(scope['headers'])
+        content_length = headers.get(b'content-length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            received += len(message.get('body', b''))
+            if received > self.max_size:
+                too_large = True
+                raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+
+        async def checked_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                if response_started:
+                    return
+                response_started = True
+                # NOTE: 内层中间件可能把接收时抛出的异常转换为其他错误响应, 统一替换为413
+                if too_large:
+                    await self.reject(scope, receive, send)
+                    return
+            elif too_large:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, checked_send)
+        except Exception:
+            if not too_large or response_started:
+                raise
+            await self.reject(scope, receive, send)
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse({'detail': 'Upload too large'}, status_code=413)
+        await response(scope, receive, send)
+
+async def save_upload(upload: UploadFile, max_size: int = UPLOAD_MAX_SIZE) -> str:
+    """
+    将上传文件分块写入临时文件
+
+    Returns:
+        str: 临时文件路径, 由调用方删除
+
+    Raises:
+        HTTPException: 文件超出大小上限时返回413
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix="ballkeeper_upload_")
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=413, detail="Upload too large")
+                await run_in_threadpool(f.write, chunk)
+        return tmp_path
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -1,6 +1,8 @@
+import os
+import re
 from datetime import datetime
-from PIL import Image
-import io
+from envs import IMG_VARIANT_SIZES
+import hashlib
 import logging
 
 logger = logging.getLogger("ballkeeper")
@@ -12,73 +14,74 @@ def path_from_dir(dir):
 def strfnow():
     return datetime.now().strftime("%Y%m%d%H%M%S%f")
 
-def get_img_path(image_type, ext):
-    return f"/images/{image_type}_{strfnow()}{ext}"
-
-def compress_image(image_data: bytes, file_extension: str, max_size: int = 100 * 1024) -> bytes:
+def _digest(data: bytes):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+def _shard(digest, filename):
+    """按哈希前4位分两级子目录: ab/cd/filename"""
+    return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+# 内容哈希命名的图片文件名: 哈希[_v已生成的变体尺寸][_变体尺寸].扩展名, 如 team_<哈希>_v64-256.png, 内容永不改变, 可以长期缓存
+HASHED_NAME = re.compile(r'(?:^|_)[0-9a-f]{32}(?:_v(\d+(?:-\d+)*))?(?:_\d+)?\.\w+$')
+
+def is_hashed_name(filename):
+    return HASHED_NAME.search(filename) is not None
+
+def variant_sizes(edge):
+    """长边为edge的图片要生成的变体尺寸: 只生成比原图小的变体, 不放大"""
+    return tuple(size for size in IMG_VARIANT_SIZES if size < edge)
+
+def _sizes_suffix(sizes):
+    # 文件名中记录生成时实际生成的变体尺寸, 之后修改 IMG_VARIANT_SIZES 不影响已有图片
+    return f"_v{'-'.join(str(size) for size in sizes)}" if sizes else ""
+
+def get_img_key(image_type, ext, data, sizes=()):
+    """上传图片的存储key, 文件名包含图片内容的哈希和已生成的变体尺寸"""
+    digest = _digest(data)
+    return _shard(digest, f"{image_type}_{digest}{_sizes_suffix(sizes)}{ext}")
+
+# NOTE: 默认图片渲染逻辑变化时递增, 避免新旧图片共用同一路径
+# 2: 同时生成尺寸变体
+# 3: 只生成比原图小的变体
+# 4: 文件名记录已生成的变体尺寸
+DEFAULT_IMG_VERSION = 4
+
+def get_txt_img_key(image_type, text, size, colors):
+    """随机颜色的文字图片的存储key, 由(文字, 尺寸, 颜色)决定, 相同输入渲染出的图片相同"""
+    digest = _digest(f"{DEFAULT_IMG_VERSION}|{text}|{size[0]}x{size[1]}|{colors}".encode('utf8'))
+    return _shard(digest, f"{image_type}_{digest}{_sizes_suffix(variant_sizes(max(size)))}.png")
+
+def get_default_img_key(text, size):
+    """确定性默认图片的存储key, 由(文字, 尺寸)唯一决定"""
+    digest = _digest(f"{DEFAULT_IMG_VERSION}|{text}|{size[0]}x{size[1]}".encode('utf8'))
+    return f"default/{_shard(digest, f'{digest}{_sizes_suffix(variant_sizes(max(size)))}.png')}"
+
+def get_variant_path(img_path, size):
+    """图片尺寸变体的key或URL: ab/cd/team_xxx_v64-256.png => ab/cd/team_xxx_v64-256_64.png"""
+    root, ext = os.path.splitext(img_path)
+    return f"{root}_{size}{ext}"
+
+def recorded_sizes(img_path):
+    """文件名中记录的已生成变体尺寸; 没有记录的图片(早期上传、按时间戳命名)没有可用的变体"""
+    match = HASHED_NAME.search(os.path.basename(img_path or ''))
+    if match is None or not match.group(1):
+        return ()
+    return tuple(int(size) for size in match.group(1).split('-'))
+
+def image_variants(img_path):
+    """图片已有的尺寸变体: {尺寸: URL}, 只取决于文件名, 与当前的 IMG_VARIANT_SIZES 配置无关"""
+    return {size: get_variant_path(img_path, size) for size in recorded_sizes(img_path)}
+
+def pick_variant(img_path, img_size=None):
     """
-    压缩图片至指定大小以内
-
-    Args:
-        image_data: 原始图片数据
-        file_extension: 文件扩展名（带.）如.jpg、.png
-        max_size: 最大文件大小（字节），默认100KB
+    按尺寸提示选择图片URL
 
-    Returns:
-        bytes: 压缩后的图片数据
+    返回长边不小于img_size的最小尺寸变体; 没有提示、没有满足的变体(原图不大于img_size)
+    或文件名未记录变体的图片(早期上传)返回原图
     """
-    img_len = len(image_data)
-    # 如果原始图片已经小于最大尺寸，直接返回
-    if img_len <= max_size:
-        logger.info(f"image size[{img_len}] <= {max_size}, return")
-        return image_data
-
-    logger.info(f"image size[{img_len}] > {max_size}, compressing...")
-
-    # 打开图片
-    img = Image.open(io.BytesIO(image_data))
-
-    # 根据不同格式使用不同压缩方法
-    output = io.BytesIO()
-    file_extension = file_extension.lower()
-
-    if file_extension in ['.jpg', '.jpeg']:
-        # JPEG压缩：调整质量
-        quality = 90
-        while quality > 10:
-            output.seek(0)
-            output.truncate(0)
-            img.save(output, format='JPEG', quality=quality)
-            if output.tell() <= max_size:
-                break
-            quality -= 10
-
-    elif file_extension == '.png':
-        # PNG压缩：转换为RGB模式（移除透明通道）并调整大小
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-
-        # 保持宽高比调整大小
-        width, height = img.size
-        ratio = min(1.0, max_size / len(image_data))
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
-
-        img = img.resize((new_width, new_height), Image.LANCZOS)
-        img.save(output, format='PNG', optimize=True)
-
-    else:
-        # 其他格式，简单调整大小
-        width, height = img.size
-        ratio = min(1.0, max_size / len(image_data))
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
-
-        img = img.resize((new_width, new_height), Image.LANCZOS)
-        img.save(output, format=file_extension[1:].upper())
-
-    # 获取压缩后的图片数据
-    compressed_data = output.getvalue()
-    logger.info(f"compressed size: {len(compressed_data)/1024:.2f}KB")
-
-    return compressed_data
+    if not img_path or not img_size:
+        return img_path
+    for size, variant_path in image_variants(img_path).items():
+        if size >= img_size:
+            return variant_path
+    return img_path